@@ -0,0 +1,225 @@
+import re
+import string
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from esnli_io import read_rows
+from patterns.abstract import AbstractPattern, StructuredExplanation
+from patterns.common import nlp
+from structuring import N_EXPLANATIONS, build_pattern_sets, get_highlights, is_missing, result_structure
+
+# punctuation is removed from highlights by ESNLIPreprocessor, and from predicates here alike
+_PUNCTUATION_RE = f"[{re.escape(string.punctuation)}]"
+
+
+def _relations(expl: StructuredExplanation) -> Iterable[StructuredExplanation]:
+    stack = [expl]
+    while stack:
+        se = stack.pop()
+        if se.relationship == '∧':
+            stack.extend(reversed([p for p in se.predicates if isinstance(p, StructuredExplanation)]))
+        elif se:
+            yield se
+
+
+def _add_predicates(records: list, group: int, pattern: str, expl: StructuredExplanation):
+    for relation in _relations(expl):
+        for position, predicate in enumerate(relation.predicates):
+            if isinstance(predicate, str):
+                side = 0 if position == 0 else 1
+                records.append((group, pattern, side, predicate))
+
+
+def collect(rows: Iterable[dict], pattern_sets: Optional[Dict[str, List[AbstractPattern]]] = None,
+            batch_size: int = 256) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Structure e-SNLI rows applying every pattern class on its own, so that each predicate can be
+    attributed to the class that produced it.
+
+    Args:
+        rows (iterable): raw or preprocessed e-SNLI rows as dicts.
+        pattern_sets (dict): label -> pattern instances, built with build_pattern_sets if not given.
+        batch_size (int): number of rows parsed together.
+
+    Returns:
+        tuple: predicates (group, pattern, side, text) and highlights (group, text) data frames,
+        a group being one explanation of one row.
+    """
+    pattern_sets = pattern_sets or build_pattern_sets()
+    predicates, highlights = [], []
+    group = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        jobs = []
+        for row in batch:
+            for n in range(1, N_EXPLANATIONS + 1):
+                text = row.get(f'Explanation_{n}')
+                if not is_missing(text):
+                    jobs.append((row, get_highlights(row, n), str(text)))
+        for (row, row_highlights, _), doc in zip(jobs, nlp.pipe([text for _, _, text in jobs], batch_size=batch_size)):
+            highlights.extend((group, h) for h in row_highlights)
+            for pattern in pattern_sets.get(row.get('gold_label'), []):
+                expl = pattern(doc, row_highlights)
+                if expl:
+                    _add_predicates(predicates, group, type(pattern).__name__, expl)
+            group += 1
+    return (
+        pd.DataFrame(predicates, columns=['group', 'pattern', 'side', 'text']),
+        pd.DataFrame(highlights, columns=['group', 'text']),
+    )
+
+
+def collect_results(rows: Iterable[dict], results: Iterable[dict]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Same as collect, from existing run_structuring.py results aligned with their rows by pairID.
+    The results do not record which class produced a predicate, all are attributed to 'all'.
+    """
+    structures = {}
+    for result in results:
+        for n in range(1, N_EXPLANATIONS + 1):
+            structure = result_structure(result, n)
+            if structure is not None:
+                structures[result['pairID'], n] = structure
+
+    predicates, highlights = [], []
+    group = 0
+    for row in rows:
+        for n in range(1, N_EXPLANATIONS + 1):
+            if is_missing(row.get(f'Explanation_{n}')):
+                continue
+            highlights.extend((group, h) for h in get_highlights(row, n))
+            expl = structures.get((row.get('pairID'), n))
+            if expl:
+                _add_predicates(predicates, group, 'all', expl)
+            group += 1
+    return (
+        pd.DataFrame(predicates, columns=['group', 'pattern', 'side', 'text']),
+        pd.DataFrame(highlights, columns=['group', 'text']),
+    )
+
+
+def _normalize(texts: pd.Series) -> pd.Series:
+    return texts.astype(str).str.lower().str.replace(_PUNCTUATION_RE, '', regex=True).str.strip()
+
+
+def _tokens(phrases: pd.Series) -> Tuple[np.ndarray, pd.Series]:
+    """
+    Whitespace tokens of normalized phrases, as the row of every token and the tokens themselves.
+    """
+    split = phrases.str.split()
+    lengths = split.str.len().fillna(0).to_numpy(dtype=np.int64)
+    # empty token lists explode to a missing value
+    tokens = split.explode().dropna()
+    return np.repeat(np.arange(len(phrases)), lengths), tokens
+
+
+def alignment_metrics(predicates: pd.DataFrame, highlights: pd.DataFrame) -> pd.DataFrame:
+    """
+    Alignment of the predicates with the highlights of their explanation, per pattern class.
+    Phrases and tokens are encoded as ids of a vocabulary shared by predicates and highlights, and
+    membership of a (explanation, id) pair is tested on group * vocabulary size + id keys with
+    np.isin, so that the whole split is handled without a Python loop per row.
+
+    Args:
+        predicates (pd.DataFrame): group, pattern, side and text of every predicate, see collect.
+        highlights (pd.DataFrame): group and text of every highlighted phrase.
+
+    Returns:
+        pd.DataFrame: per pattern class (and 'all'): number of predicates, fraction grounded
+        (equal to a highlighted phrase, as _get_grounded_terms does), fraction of left and right
+        predicates grounded, mean fraction of predicate tokens highlighted (token_precision),
+        and fraction of highlighted tokens found in a predicate of the same explanation, over the
+        explanations where the class found something (token_recall).
+    """
+    pred_phrases = _normalize(predicates['text'])
+    hl_phrases = _normalize(highlights['text'])
+    pred_group = predicates['group'].to_numpy(dtype=np.int64)
+    hl_group = highlights['group'].to_numpy(dtype=np.int64)
+
+    # grounded: the whole predicate is one of the highlighted phrases of its explanation
+    phrase_ids, phrase_vocab = pd.factorize(pd.concat([pred_phrases, hl_phrases], ignore_index=True))
+    n_phrases = max(len(phrase_vocab), 1)
+    grounded = np.isin(pred_group * n_phrases + phrase_ids[:len(pred_phrases)],
+                       hl_group * n_phrases + phrase_ids[len(pred_phrases):])
+
+    # token overlap, with a token vocabulary shared by predicates and highlights
+    pred_rows, pred_tokens = _tokens(pred_phrases)
+    hl_rows, hl_tokens = _tokens(hl_phrases)
+    token_ids, token_vocab = pd.factorize(pd.concat([pred_tokens, hl_tokens], ignore_index=True))
+    n_tokens = max(len(token_vocab), 1)
+    pred_keys = pred_group[pred_rows] * n_tokens + token_ids[:len(pred_tokens)]
+    hl_keys = hl_group[hl_rows] * n_tokens + token_ids[len(pred_tokens):]
+
+    highlighted = np.isin(pred_keys, hl_keys)
+    token_counts = np.bincount(pred_rows, minlength=len(predicates))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.bincount(pred_rows, weights=highlighted, minlength=len(predicates)) / token_counts
+
+    side = predicates['side'].to_numpy()
+    frame = pd.DataFrame({
+        'pattern': predicates['pattern'].to_numpy(),
+        'grounded': grounded,
+        'left_grounded': np.where(side == 0, grounded, np.nan),
+        'right_grounded': np.where(side == 1, grounded, np.nan),
+        'token_precision': precision,
+    })
+    by_pattern = frame.groupby('pattern', sort=True)
+    summary = by_pattern.agg(
+        predicates=('grounded', 'size'),
+        grounded=('grounded', 'mean'),
+        left_grounded=('left_grounded', 'mean'),
+        right_grounded=('right_grounded', 'mean'),
+        token_precision=('token_precision', 'mean'),
+    )
+    overall = frame.drop(columns='pattern').agg('mean')
+    overall['predicates'] = len(frame)
+    summary.loc['all'] = overall[summary.columns]
+
+    # recall of the highlighted tokens, restricted to the explanations each class found something in
+    recall = {}
+    token_pattern = frame['pattern'].to_numpy()[pred_rows]
+    hl_token_group = hl_group[hl_rows]
+    for pattern in list(summary.index[:-1]) + ['all']:
+        keys = pred_keys if pattern == 'all' else pred_keys[token_pattern == pattern]
+        in_scope = np.isin(hl_token_group, np.unique(keys // n_tokens))
+        recall[pattern] = float(np.isin(hl_keys[in_scope], keys).mean()) if in_scope.any() else np.nan
+    summary['token_recall'] = pd.Series(recall)
+    summary['predicates'] = summary['predicates'].astype(int)
+    return summary
+
+
+def main():
+    argparser = ArgumentParser(
+        prog="Highlight alignment metrics for Structured e-SNLI",
+        description="Measure how the predicates of the structured explanations align with the annotator highlights",
+        epilog="LoLa Project"
+    )
+    argparser.add_argument('input', help="raw or cleaned e-SNLI csv/jsonl file")
+    argparser.add_argument('--results', help="output of run_structuring.py for the input, instead of structuring it "
+                                             "(predicates are then not attributed to pattern classes)")
+    argparser.add_argument('--batch-size', type=int, default=256, help="number of rows parsed together")
+    argparser.add_argument('--json', type=Path, help="also write the metrics to this json file")
+
+    args = argparser.parse_args()
+
+    rows = read_rows(args.input)
+    if args.results:
+        predicates, highlights = collect_results(rows, read_rows(args.results))
+    else:
+        predicates, highlights = collect(rows, batch_size=args.batch_size)
+
+    summary = alignment_metrics(predicates, highlights)
+    with pd.option_context('display.float_format', '{:.4f}'.format, 'display.max_columns', None, 'display.width', 160):
+        print(summary)
+    if args.json:
+        args.json.write_text(summary.reset_index().to_json(orient='records', indent=2))
+
+
+if __name__ == '__main__':
+    main()
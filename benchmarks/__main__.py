@@ -0,0 +1,107 @@
+import json
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import List
+from benchmarks.corpus import load_corpus
+from benchmarks.harness import BenchmarkResult, format_table
+from benchmarks import compare
+
+SUITES = ['preprocessing', 'patterns', 'explanations']
+
+
+def run_suites(size: str, suites: List[str] = SUITES, repeat: int = 3, memory: bool = True) -> List[BenchmarkResult]:
+    """
+    Run the selected benchmark suites on the corpus of the given size.
+    """
+    # imported here so that building corpora does not need to load the spaCy model
+    from preprocessing import ESNLIPreprocessor
+    from benchmarks import bench_preprocessing, bench_patterns, bench_explanations
+
+    corpus = load_corpus(size)
+    results = []
+    if 'preprocessing' in suites:
+        results.extend(bench_preprocessing.run(corpus, repeat, memory))
+
+    if 'patterns' in suites or 'explanations' in suites:
+        preprocessed = ESNLIPreprocessor(corpus.copy()).create_ordered_highlights_as_list()
+        if 'patterns' in suites:
+            results.extend(bench_patterns.run(bench_patterns.prepare(preprocessed), repeat, memory))
+        if 'explanations' in suites:
+            results.extend(bench_explanations.run(bench_explanations.prepare(preprocessed), repeat, memory))
+    return results
+
+
+def main():
+    argparser = ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmarks for the preprocessing and the pattern matching of Structured e-SNLI",
+    )
+    subparsers = argparser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="run the benchmarks and print a report")
+    run_parser.add_argument('--size', default='10k', help="corpus size, e.g. 10k or 100k")
+    run_parser.add_argument('--only', nargs='+', choices=SUITES, default=SUITES, help="suites to run")
+    run_parser.add_argument('--repeat', type=int, default=3, help="number of timed runs, the best one is kept")
+    run_parser.add_argument('--no-memory', action='store_true', help="skip the peak memory measurement")
+    run_parser.add_argument('--json', type=Path, help="also write the results to this json file")
+
+    compare_parser = subparsers.add_parser('compare', help="run the benchmarks and compare them with the baseline")
+    compare_parser.add_argument('--baseline', type=Path, default=compare.BASELINE, help="baseline json file")
+    compare_parser.add_argument('--size', help="corpus size, defaults to the size of the baseline")
+    compare_parser.add_argument('--threshold', type=float, help="relative change allowed for metrics without their own threshold, e.g. 0.1")
+    compare_parser.add_argument('--repeat', type=int, default=compare.DEFAULT_REPEAT, help="number of timed runs, the best one is kept")
+    compare_parser.add_argument('--output', type=Path, default=Path("benchmarks/results.json"), help="json file for the results")
+    compare_parser.add_argument('--skip-rss', action='store_true', help="do not measure the peak RSS of run_preprocessing.py")
+    compare_parser.add_argument('--update-baseline', action='store_true', help="store the results as the new baseline instead of comparing")
+    compare_parser.add_argument('--allow-missing', action='store_true', help="only warn about tracked metrics without a baseline or a current value")
+
+    args = argparser.parse_args()
+
+    if args.command == 'run':
+        results = run_suites(args.size, args.only, args.repeat, not args.no_memory)
+        print(format_table(results))
+        if args.json:
+            args.json.write_text(json.dumps([r.to_dict() for r in results], indent=2))
+
+    elif args.command == 'compare':
+        baseline = compare.load_baseline(args.baseline)
+        # without baseline values nothing would be compared and the gate would always pass
+        if not baseline.get("metrics") and not (args.update_baseline or args.allow_missing):
+            argparser.error(f"{args.baseline} has no baseline metrics, record them with --update-baseline")
+        current = compare.environment()
+        if args.update_baseline and not compare.has_parser():
+            argparser.error(f"the spaCy model {current['spacy_model']} has no parser, record the baseline with the trained model")
+        recorded = baseline.get("machine", {})
+        # the pattern throughput depends on the parses, numbers of another model are not comparable
+        if not args.update_baseline and recorded.get("spacy_model", current["spacy_model"]) != current["spacy_model"]:
+            argparser.error(f"baseline measured with the spaCy model {recorded['spacy_model']}, current {current['spacy_model']}")
+        size = args.size or baseline.get("size", "10k")
+        results = run_suites(size, ['preprocessing', 'patterns'], args.repeat)
+        metrics = compare.collect_metrics(results)
+        if not args.skip_rss:
+            metrics.update(compare.measure_run_preprocessing(size))
+
+        if args.update_baseline:
+            compare.update_baseline(metrics, baseline, size, args.baseline)
+            print(f"baseline written to {args.baseline}")
+            return
+
+        for key, value in recorded.items():
+            if current.get(key) != value:
+                print(f"warning: baseline measured with {key} {value}, current {current.get(key)}")
+        comparisons = compare.compare(metrics, baseline, args.threshold)
+        compare.write_report(args.output, size, metrics, comparisons)
+        print(compare.format_comparisons(comparisons))
+        missing = compare.missing_metrics(metrics, baseline)
+        if args.skip_rss:
+            missing = [m for m in missing if m not in compare.RSS_METRICS]
+        for metric in missing:
+            level = "warning" if args.allow_missing else "error"
+            print(f"{level}: no baseline or current value for {metric}, run with --update-baseline to record it")
+        if any(c.regressed for c in comparisons) or (missing and not args.allow_missing):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
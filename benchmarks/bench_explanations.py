@@ -0,0 +1,50 @@
+import copy
+import pandas as pd
+from typing import List, Tuple
+from patterns.abstract import AbstractPattern, StructuredExplanation, parse_series
+from structuring import get_highlights
+from benchmarks.harness import BenchmarkResult, measure
+
+
+def prepare(preprocessed: pd.DataFrame) -> Tuple[List[StructuredExplanation], List[Tuple[str, str, List[str]]]]:
+    """
+    Build the explanations from the gold structured explanations of the corpus, and the
+    (left, right, highlights) triples of their two-predicate relationships for grounding.
+    """
+    gold = parse_series(preprocessed['structured_explanation'], errors='coerce')
+    explanations, grounding = [], []
+    for expl, (_, row) in zip(gold, preprocessed.iterrows()):
+        if not expl:
+            continue
+        explanations.append(expl)
+        highlights = get_highlights(row, 1)
+        stack = [expl]
+        while stack:
+            se = stack.pop()
+            if se.relationship != '∧' and len(se.predicates) == 2 and all(isinstance(p, str) for p in se.predicates):
+                grounding.append((se.predicates[0], se.predicates[1], highlights))
+            stack.extend(p for p in se.predicates if isinstance(p, StructuredExplanation))
+    return explanations, grounding
+
+
+def run(inputs: Tuple[List[StructuredExplanation], List[Tuple[str, str, List[str]]]], repeat: int = 3, memory: bool = True) -> List[BenchmarkResult]:
+    """
+    Time StructuredExplanation equality and concatenation, and the grounding of predicates
+    on the highlights.
+    """
+    explanations, grounding = inputs
+    # parsed explanations are cached, compare against copies so that the trees are really walked
+    copies = copy.deepcopy(explanations)
+    groups = [explanations[i:i + 3] for i in range(0, len(explanations), 3)]
+
+    return [
+        measure("explanations.equality",
+                lambda: [a == b for a, b in zip(explanations, copies)],
+                len(explanations), repeat=repeat, memory=memory),
+        measure("explanations.concatenate",
+                lambda: [AbstractPattern.concatenate_explanations(group) for group in groups],
+                len(groups), repeat=repeat, memory=memory),
+        measure("explanations.grounding",
+                lambda: [AbstractPattern._get_grounded_terms(left, right, h) for left, right, h in grounding],
+                len(grounding), repeat=repeat, memory=memory),
+    ]
@@ -0,0 +1,55 @@
+import pandas as pd
+from typing import Dict, List, Tuple
+from spacy.tokens.doc import Doc
+from patterns.common import nlp
+from patterns.abstract import AbstractPattern
+from patterns.entailment import BASE_IMPLICATION_PATTERNS
+from structuring import LABELS, build_pattern_sets, get_highlights, structure
+from benchmarks.harness import BenchmarkResult, measure
+
+
+def prepare(preprocessed: pd.DataFrame) -> Dict[str, Tuple[List[Doc], List[List[str]]]]:
+    """
+    Parse the first explanation of every row ahead of time, so that the pattern benchmarks
+    only measure the pattern matching.
+
+    Returns:
+        dict: label -> (parsed explanations, highlights).
+    """
+    inputs = {}
+    for label in LABELS:
+        rows = preprocessed[preprocessed['gold_label'] == label]
+        texts = rows['Explanation_1'].fillna('').astype(str).tolist()
+        docs = list(nlp.pipe(texts, batch_size=256))
+        highlights = [get_highlights(row, 1) for _, row in rows.iterrows()]
+        inputs[label] = (docs, highlights)
+    return inputs
+
+
+def run(inputs: Dict[str, Tuple[List[Doc], List[List[str]]]], repeat: int = 3, memory: bool = True) -> List[BenchmarkResult]:
+    """
+    Time the generation of the pattern tables, every pattern class on the explanations of
+    its label and every label's full pattern set.
+    """
+    results = [
+        measure("patterns._generate_inflected_patterns",
+                lambda: AbstractPattern._generate_inflected_patterns(BASE_IMPLICATION_PATTERNS),
+                len(BASE_IMPLICATION_PATTERNS), repeat=repeat, memory=memory),
+        measure("patterns._generate_negative_patterns",
+                lambda: AbstractPattern._generate_negative_patterns(BASE_IMPLICATION_PATTERNS),
+                len(BASE_IMPLICATION_PATTERNS), repeat=repeat, memory=memory),
+        measure("patterns.build_pattern_sets", build_pattern_sets, 1, repeat=repeat, memory=memory),
+    ]
+
+    for label, patterns in build_pattern_sets().items():
+        docs, highlights = inputs[label]
+        if not docs:
+            continue
+        for pattern in patterns:
+            call = lambda pattern=pattern: [pattern(doc, h) for doc, h in zip(docs, highlights)]
+            results.append(measure(f"patterns.{label}.{type(pattern).__name__}", call, len(docs), repeat=repeat, memory=memory))
+
+        call_set = lambda patterns=patterns: [structure(doc, h, patterns) for doc, h in zip(docs, highlights)]
+        results.append(measure(f"patterns.{label}_set", call_set, len(docs), repeat=repeat, memory=memory))
+
+    return results
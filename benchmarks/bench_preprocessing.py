@@ -0,0 +1,34 @@
+import pandas as pd
+from typing import List
+from preprocessing import ESNLIPreprocessor, PIPELINE_STAGES as STAGES
+from benchmarks.harness import BenchmarkResult, measure
+
+
+def run(corpus: pd.DataFrame, repeat: int = 3, memory: bool = True) -> List[BenchmarkResult]:
+    """
+    Time every stage of ESNLIPreprocessor on the raw corpus, each stage running on the output
+    of the previous ones, and the whole pipeline as run by run_preprocessing.py.
+    """
+    preprocessor = ESNLIPreprocessor(corpus.copy())
+    results = []
+
+    def setup_from(data):
+        def setup():
+            preprocessor.data = data.copy()
+            return preprocessor
+        return setup
+
+    data = corpus
+    for stage in STAGES:
+        run_stage = lambda p, stage=stage: getattr(p, stage)()
+        results.append(measure(f"preprocessing.{stage}", run_stage, len(corpus), setup_from(data), repeat, memory))
+        preprocessor.data = data.copy()
+        run_stage(preprocessor)
+        data = preprocessor.data
+
+    def pipeline(p):
+        for stage in STAGES:
+            getattr(p, stage)()
+
+    results.append(measure("preprocessing.pipeline", pipeline, len(corpus), setup_from(corpus), repeat, memory))
+    return results
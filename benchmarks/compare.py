@@ -0,0 +1,163 @@
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+from benchmarks.corpus import corpus_path, load_corpus
+from benchmarks.harness import BenchmarkResult
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_THRESHOLD = 0.10
+# the best of 3 runs still varied by about 15% between runs on the same machine
+DEFAULT_REPEAT = 5
+# metrics ending with one of these suffixes regress when they grow, all others when they shrink
+LOWER_IS_BETTER = ('.seconds', '.latency_us', '.peak_bytes', '.peak_rss_bytes')
+# metrics measured by measure_run_preprocessing, absent on purpose with --skip-rss
+RSS_METRICS = ('run_preprocessing.peak_rss_bytes',)
+
+
+@dataclass
+class Comparison:
+    metric: str
+    baseline: float
+    current: float
+    change: float
+    threshold: float
+    regressed: bool
+
+
+def collect_metrics(results: List[BenchmarkResult]) -> Dict[str, float]:
+    """
+    Flatten benchmark results into a metric name -> value mapping.
+    """
+    metrics = {}
+    for r in results:
+        metrics[f"{r.name}.items_per_second"] = r.items_per_second
+        if r.peak_bytes is not None:
+            metrics[f"{r.name}.peak_bytes"] = r.peak_bytes
+    return metrics
+
+
+def measure_run_preprocessing(size: str) -> Dict[str, float]:
+    """
+    Run run_preprocessing.py on a copy of the corpus in a child process and return its peak
+    resident memory.
+    """
+    load_corpus(size)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = Path(tmp) / corpus_path(size).name
+        shutil.copy(corpus_path(size), corpus)
+        subprocess.run([sys.executable, str(ROOT / "run_preprocessing.py"), str(corpus)], check=True)
+
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = max_rss if sys.platform == 'darwin' else max_rss * 1024
+    return {RSS_METRICS[0]: peak_rss}
+
+
+def environment() -> Dict[str, str]:
+    """
+    Machine, library versions and spaCy model the metrics were measured with, recorded with the
+    baseline since throughput numbers are only comparable on the same setup.
+    """
+    import spacy
+    from patterns.common import nlp
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": str(os.cpu_count()),
+        "python": platform.python_version(),
+        "spacy": spacy.__version__,
+        "spacy_model": f"{nlp.meta.get('lang')}_{nlp.meta.get('name')} {nlp.meta.get('version')}",
+    }
+
+
+def has_parser() -> bool:
+    """
+    Whether the loaded spaCy model parses, the patterns do not match anything without it.
+    """
+    from patterns.common import nlp
+    return "parser" in nlp.pipe_names
+
+
+def load_baseline(path: Path = BASELINE) -> dict:
+    if not path.exists():
+        return {"threshold": DEFAULT_THRESHOLD, "tracked": [], "thresholds": {}, "metrics": {}}
+    return json.loads(path.read_text())
+
+
+def compare(metrics: Dict[str, float], baseline: dict, threshold: Optional[float] = None) -> List[Comparison]:
+    """
+    Compare the current metrics with the baseline ones. Only the metrics listed in the
+    baseline's "tracked" list are compared, or all of its metrics if the list is empty.
+    A metric regresses when it gets worse by more than its threshold, taken from the
+    baseline's "thresholds", then from `threshold`, then from the baseline's "threshold".
+
+    Args:
+        metrics (dict): current metric values.
+        baseline (dict): content of the baseline file.
+        threshold (float): relative change allowed, e.g. 0.1 for 10%.
+
+    Returns:
+        list: one Comparison per tracked metric with both a baseline and a current value,
+        see missing_metrics for the others.
+    """
+    default = threshold if threshold is not None else baseline.get("threshold", DEFAULT_THRESHOLD)
+    tracked = baseline.get("tracked") or list(baseline.get("metrics", {}))
+    comparisons = []
+    for metric in tracked:
+        if metric not in baseline.get("metrics", {}) or metric not in metrics:
+            continue
+        base, current = baseline["metrics"][metric], metrics[metric]
+        change = (current - base) / base if base else 0.0
+        limit = baseline.get("thresholds", {}).get(metric, default)
+        regressed = change > limit if metric.endswith(LOWER_IS_BETTER) else change < -limit
+        comparisons.append(Comparison(metric, base, current, change, limit, regressed))
+    return comparisons
+
+
+def missing_metrics(metrics: Dict[str, float], baseline: dict) -> List[str]:
+    """
+    Tracked metrics that have no baseline value or were not measured, e.g. after a benchmark
+    was renamed. compare cannot check them, so the gate fails on them unless told otherwise.
+    """
+    tracked = baseline.get("tracked") or list(baseline.get("metrics", {}))
+    return [m for m in tracked if m not in baseline.get("metrics", {}) or m not in metrics]
+
+
+def update_baseline(metrics: Dict[str, float], baseline: dict, size: str, path: Path = BASELINE):
+    """
+    Store the current metrics in the baseline with the environment they were measured in, keeping
+    the tracked list, the thresholds and the baseline values of the metrics that were not
+    measured, e.g. the peak RSS with --skip-rss.
+    """
+    baseline = dict(baseline, size=size, machine=environment(), metrics=dict(baseline.get("metrics", {}), **metrics))
+    path.write_text(json.dumps(baseline, indent=2, ensure_ascii=False) + "\n")
+
+
+def format_comparisons(comparisons: List[Comparison]) -> str:
+    header = f"{'metric':<64} {'baseline':>14} {'current':>14} {'change':>9} {'limit':>7}  status"
+    lines = [header, "-" * len(header)]
+    for c in comparisons:
+        status = "REGRESSED" if c.regressed else "ok"
+        lines.append(
+            f"{c.metric:<64} {c.baseline:>14.1f} {c.current:>14.1f} {c.change:>+9.1%} {c.threshold:>7.0%}  {status}"
+        )
+    return "\n".join(lines)
+
+
+def write_report(path: Path, size: str, metrics: Dict[str, float], comparisons: List[Comparison]):
+    report = {
+        "size": size,
+        "metrics": metrics,
+        "comparisons": [asdict(c) for c in comparisons],
+        "regressed": any(c.regressed for c in comparisons),
+    }
+    path.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n")
@@ -0,0 +1,74 @@
+import pandas as pd
+from argparse import ArgumentParser
+from pathlib import Path
+
+SOURCE = Path(__file__).resolve().parent.parent / "data" / "assigned_samples_training.csv"
+CORPUS_DIR = Path(__file__).resolve().parent / "data"
+CORPUS_SIZES = {'10k': 10_000, '100k': 100_000}
+
+
+def parse_size(size: str) -> int:
+    """
+    Convert a corpus size such as '10k', '100k' or '2500' to a number of rows.
+    """
+    if size in CORPUS_SIZES:
+        return CORPUS_SIZES[size]
+    if size.lower().endswith('k'):
+        return int(size[:-1]) * 1000
+    return int(size)
+
+
+def corpus_path(size: str) -> Path:
+    return CORPUS_DIR / f"corpus_{size}.csv"
+
+
+def build_corpus(n_rows: int, source: Path = SOURCE) -> pd.DataFrame:
+    """
+    Replicate the rows of the source split until the corpus has n_rows rows.
+    The corpus is deterministic: row k is a copy of source row k % len(source) and copies
+    get a '-<k // len(source)>' suffix on their pairID so that pairIDs stay unique.
+
+    Args:
+        n_rows (int): number of rows of the corpus.
+        source (Path): raw e-SNLI csv file to replicate.
+
+    Returns:
+        pd.DataFrame: the corpus, in the raw e-SNLI column layout.
+    """
+    data = pd.read_csv(source)
+    copies = -(-n_rows // len(data))
+    corpus = pd.concat([data] * copies, ignore_index=True).iloc[:n_rows].copy()
+    copy_idx = corpus.index // len(data)
+    corpus['pairID'] = [
+        pair_id if k == 0 else f"{pair_id}-{k}" for pair_id, k in zip(corpus['pairID'], copy_idx)
+    ]
+    return corpus
+
+
+def load_corpus(size: str) -> pd.DataFrame:
+    """
+    Load the corpus of the given size, building it first if it does not exist yet.
+    """
+    path = corpus_path(size)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        build_corpus(parse_size(size)).to_csv(path, index=False)
+    return pd.read_csv(path)
+
+
+def main():
+    argparser = ArgumentParser(
+        prog="python -m benchmarks.corpus",
+        description="Build the fixed benchmark corpora from data/assigned_samples_training.csv",
+    )
+    argparser.add_argument('sizes', nargs='*', default=list(CORPUS_SIZES), help="corpus sizes, e.g. 10k 100k")
+    args = argparser.parse_args()
+
+    CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+    for size in args.sizes:
+        build_corpus(parse_size(size)).to_csv(corpus_path(size), index=False)
+        print(f"wrote {corpus_path(size)}")
+
+
+if __name__ == '__main__':
+    main()
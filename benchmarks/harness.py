@@ -0,0 +1,84 @@
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, List, Optional
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Timing of one benchmark: `seconds` is the best wall-clock time over the repeats to process
+    `items` items, `peak_bytes` the peak memory allocated during a separate traced run.
+    """
+
+    name: str
+    items: int
+    seconds: float
+    peak_bytes: Optional[int] = None
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else float('inf')
+
+    @property
+    def latency_us(self) -> float:
+        return self.seconds / self.items * 1e6 if self.items else 0.0
+
+    def to_dict(self) -> dict:
+        result = asdict(self)
+        result['items_per_second'] = self.items_per_second
+        result['latency_us'] = self.latency_us
+        return result
+
+
+def measure(name: str, fn: Callable[..., Any], items: int, setup: Optional[Callable[[], Any]] = None,
+            repeat: int = 3, memory: bool = True) -> BenchmarkResult:
+    """
+    Time fn over `repeat` runs and keep the best one. When setup is given, fn is called with
+    its return value and setup is run outside of the timed region before every run.
+    Peak memory is measured with tracemalloc in an extra run, so that tracing does not
+    slow down the timed runs.
+
+    Args:
+        name (str): name of the benchmark.
+        fn (callable): code to measure.
+        items (int): number of items processed by one call of fn.
+        setup (callable): optional function building the input of fn.
+        repeat (int): number of timed runs.
+        memory (bool): whether to measure peak memory.
+
+    Returns:
+        BenchmarkResult: result of the benchmark.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state) if setup else fn()
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        state = setup() if setup else None
+        tracemalloc.start()
+        try:
+            fn(state) if setup else fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return BenchmarkResult(name, items, best, peak)
+
+
+def format_table(results: List[BenchmarkResult]) -> str:
+    """
+    Format benchmark results as a plain text table.
+    """
+    header = f"{'benchmark':<48} {'items':>8} {'seconds':>10} {'items/s':>12} {'latency (us)':>13} {'peak (MiB)':>11}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        peak = f"{r.peak_bytes / 2**20:.2f}" if r.peak_bytes is not None else "-"
+        lines.append(
+            f"{r.name:<48} {r.items:>8} {r.seconds:>10.4f} {r.items_per_second:>12.1f} {r.latency_us:>13.1f} {peak:>11}"
+        )
+    return "\n".join(lines)
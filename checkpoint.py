@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+RUN_MANIFEST = "run.json"
+
+
+def fingerprint(*parts) -> str:
+    """
+    Stable hash of json serializable parts, e.g. pattern tables, model versions or source code.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def source_fingerprint(*paths: Union[str, Path]) -> str:
+    """
+    Hash of the content of source files, so that editing the code invalidates old shards.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(p) for p in paths):
+        digest.update(path.name.encode('utf-8'))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def same_input(a: Optional[dict], b: Optional[dict]) -> bool:
+    """
+    Whether two input identities (see sharding.input_identity) describe the same file content,
+    whatever its path.
+    """
+    if a is None or b is None:
+        return a is b
+    return (a.get('size'), a.get('digest')) == (b.get('size'), b.get('digest'))
+
+
+class ShardedRun:
+    def __init__(self, directory: Union[str, Path], fingerprint: str, outputs: List[str], resume: bool = False,
+                 source: Optional[dict] = None):
+        """
+        Output of a long job written as numbered shards, each with a manifest recording its input
+        file and row range, the fingerprint of the code and model that produced it and its status.
+        Shard files are written to a temporary name and renamed once complete, so a crash only
+        ever leaves the shard in progress unfinished.
+
+        Args:
+            directory (str): directory holding the shards.
+            fingerprint (str): fingerprint of the job, shards with another fingerprint are redone.
+            outputs (list): names of the files written for every shard, e.g. ['cleaned.csv'].
+            resume (bool): keep the completed shards of a previous run, otherwise start from scratch.
+            source (dict): identity of the input file (see sharding.input_identity), shards of
+                another input are redone.
+        """
+        self.directory = Path(directory)
+        self.fingerprint = fingerprint
+        self.outputs = outputs
+        self.resume = resume
+        self.source = source
+
+        if self.directory.exists() and not resume:
+            for path in self.directory.glob("shard-*"):
+                path.unlink()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        manifest = {'fingerprint': fingerprint, 'outputs': outputs, 'input': source}
+        (self.directory / RUN_MANIFEST).write_text(json.dumps(manifest, indent=2))
+
+    def manifest_path(self, i: int) -> Path:
+        return self.directory / f"shard-{i:05d}.json"
+
+    def shard_files(self, i: int) -> Dict[str, Path]:
+        return {name: self.directory / f"shard-{i:05d}.{name}" for name in self.outputs}
+
+    def read_manifest(self, i: int) -> dict:
+        path = self.manifest_path(i)
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    def _write_manifest(self, i: int, manifest: dict):
+        tmp = self.manifest_path(i).with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(manifest, indent=2))
+        os.replace(tmp, self.manifest_path(i))
+
+    def is_complete(self, i: int, start: int, stop: int) -> bool:
+        """
+        Whether shard i was completed for the same rows of the same input with the same fingerprint.
+        """
+        manifest = self.read_manifest(i)
+        return (
+            self.resume
+            and manifest.get('status') == 'complete'
+            and manifest.get('fingerprint') == self.fingerprint
+            and same_input(manifest.get('input'), self.source)
+            and manifest.get('start') == start
+            and manifest.get('stop') == stop
+            and all(path.exists() for path in self.shard_files(i).values())
+        )
+
+    @contextmanager
+    def shard(self, i: int, start: int, stop: int) -> Iterator[Dict[str, Path]]:
+        """
+        Write shard i covering the input rows [start, stop). Yields the temporary paths to write
+        each output to; they are renamed and the shard marked complete when the block succeeds.
+        """
+        manifest = {'shard': i, 'start': start, 'stop': stop, 'fingerprint': self.fingerprint, 'input': self.source,
+                    'status': 'running'}
+        self._write_manifest(i, manifest)
+        tmp_files = {name: path.with_name(path.name + ".tmp") for name, path in self.shard_files(i).items()}
+        yield tmp_files
+        for name, path in self.shard_files(i).items():
+            os.replace(tmp_files[name], path)
+        self._write_manifest(i, dict(manifest, status='complete'))
+
+    def merge(self, n_shards: int, destinations: Dict[str, Union[str, Path]]):
+        """
+        Concatenate the outputs of shards 0 to n_shards - 1, keeping only the header of the first
+        shard for csv outputs.
+
+        Raises:
+            ValueError: if a shard is missing or not complete.
+        """
+        for i in range(n_shards):
+            manifest = self.read_manifest(i)
+            if (manifest.get('status') != 'complete' or manifest.get('fingerprint') != self.fingerprint
+                    or not same_input(manifest.get('input'), self.source)):
+                raise ValueError(f"Shard {i} in {self.directory} is not complete")
+
+        for name, destination in destinations.items():
+            with open(destination, 'wb') as out:
+                for i in range(n_shards):
+                    with open(self.shard_files(i)[name], 'rb') as f:
+                        if name.endswith('.csv') and i > 0:
+                            f.readline()
+                        shutil.copyfileobj(f, out)
@@ -0,0 +1,235 @@
+import csv
+import io
+import json
+import mmap
+import sys
+import numpy as np
+import pandas as pd
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, Union
+from preprocessing import ESNLIPreprocessor, HIGHLIGHT_DTYPES, PIPELINE_STAGES
+
+# raw columns the preprocessing expects, the train split only has the first explanation
+RAW_COLUMNS = ['pairID', 'gold_label', 'Sentence1', 'Sentence2'] + [
+    f'{column}_{i}' for i in range(1, 4) for column in (
+        'Explanation', 'Sentence1_marked', 'Sentence2_marked', 'Sentence1_Highlighted', 'Sentence2_Highlighted'
+    )
+]
+
+
+def _scan_records(path: Path) -> Tuple[bytes, Iterable[Tuple[int, bytes]]]:
+    """
+    Read the header of a csv file and return it with a generator of (byte offset, record bytes)
+    for every record. A record continues on the next line while it has an odd number of quotes,
+    i.e. while a quoted field spans several lines.
+    """
+    f = open(path, 'rb')
+    header = f.readline()
+
+    def records():
+        with f:
+            while True:
+                offset = f.tell()
+                record = f.readline()
+                if not record:
+                    return
+                while record.count(b'"') % 2:
+                    line = f.readline()
+                    if not line:
+                        break
+                    record += line
+                if record.strip():
+                    yield offset, record
+
+    return header, records()
+
+
+def build_index(csv_paths: List[Union[str, Path]], index_path: Union[str, Path], key: str = 'pairID') -> int:
+    """
+    Index the rows of one or more e-SNLI csv files by pairID. The index is a npz file holding a
+    sorted array of (key, file, offset, length) entries, the csv files and their headers.
+
+    Args:
+        csv_paths (list): csv files of the split, e.g. esnli_train_1.csv and esnli_train_2.csv.
+        index_path (str): npz file to write.
+        key (str): column to index.
+
+    Returns:
+        int: number of indexed rows.
+    """
+    index_path = Path(index_path)
+    keys, files, offsets, lengths, headers = [], [], [], [], []
+    for file_idx, path in enumerate(csv_paths):
+        header, records = _scan_records(Path(path))
+        headers.append(header.decode('utf-8'))
+        key_col = next(csv.reader([headers[-1]])).index(key)
+        for offset, record in records:
+            fields = next(csv.reader(io.StringIO(record.decode('utf-8'))))
+            keys.append(fields[key_col].encode('utf-8'))
+            files.append(file_idx)
+            offsets.append(offset)
+            lengths.append(len(record))
+
+    max_len = max((len(k) for k in keys), default=1)
+    entries = np.empty(len(keys), dtype=[('key', f'S{max_len}'), ('file', 'u2'), ('offset', 'u8'), ('length', 'u4')])
+    entries['key'] = keys
+    entries['file'] = files
+    entries['offset'] = offsets
+    entries['length'] = lengths
+    entries.sort(order='key', kind='stable')
+
+    # csv files are stored relative to the index so that both can be moved together
+    base = index_path.resolve().parent
+    stored = []
+    for path in csv_paths:
+        path = Path(path).resolve()
+        try:
+            stored.append(str(path.relative_to(base)))
+        except ValueError:
+            stored.append(str(path))
+
+    with open(index_path, 'wb') as f:
+        np.savez(f, entries=entries, meta=np.array(json.dumps({'files': stored, 'headers': headers, 'key': key})))
+    return len(entries)
+
+
+class ESNLIIndexReader:
+    def __init__(self, index_path: Union[str, Path]):
+        """
+        Random access to the rows of an indexed e-SNLI split. The csv files are memory mapped and
+        only the requested rows are parsed.
+
+        Args:
+            index_path (str): index written by build_index.
+        """
+        index_path = Path(index_path)
+        with np.load(index_path) as index:
+            self.entries = index['entries']
+            meta = json.loads(str(index['meta']))
+        base = index_path.resolve().parent
+        self.files = [base / f for f in meta['files']]
+        self.headers = [h.encode('utf-8') for h in meta['headers']]
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._handles = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, pair_id: str) -> bool:
+        return self._find(pair_id) is not None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for m in self._maps.values():
+            m.close()
+        for f in self._handles:
+            f.close()
+        self._maps.clear()
+        self._handles.clear()
+
+    def _map(self, file_idx: int) -> mmap.mmap:
+        if file_idx not in self._maps:
+            f = open(self.files[file_idx], 'rb')
+            self._handles.append(f)
+            self._maps[file_idx] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[file_idx]
+
+    def _find(self, pair_id: str):
+        key = pair_id.encode('utf-8')
+        if len(key) > self.entries.dtype['key'].itemsize:
+            return None
+        i = np.searchsorted(self.entries['key'], key)
+        if i < len(self.entries) and self.entries['key'][i] == key:
+            return self.entries[i]
+        return None
+
+    def _record(self, pair_id: str) -> Tuple[int, bytes]:
+        entry = self._find(pair_id)
+        if entry is None:
+            raise KeyError(pair_id)
+        start = int(entry['offset'])
+        return int(entry['file']), self._map(int(entry['file']))[start:start + int(entry['length'])]
+
+    def get_raw(self, pair_ids: List[str]) -> pd.DataFrame:
+        """
+        Rows of the given pairIDs, in the raw e-SNLI layout and in the requested order, parsed
+        exactly like pd.read_csv parses the whole file.
+
+        Raises:
+            KeyError: if a pairID is not in the index.
+        """
+        frames = []
+        records = [self._record(pair_id) for pair_id in pair_ids]
+        # rows of the same file are parsed together, then put back in the requested order
+        by_file: Dict[int, List[int]] = {}
+        for position, (file_idx, _) in enumerate(records):
+            by_file.setdefault(file_idx, []).append(position)
+        for file_idx, positions in by_file.items():
+            raw = self.headers[file_idx] + b''.join(
+                r if r.endswith(b'\n') else r + b'\n' for r in (records[p][1] for p in positions)
+            )
+            frames.append(pd.read_csv(io.BytesIO(raw), dtype=HIGHLIGHT_DTYPES).set_axis(positions))
+        if not frames:
+            return pd.DataFrame(columns=RAW_COLUMNS)
+        return pd.concat(frames).sort_index().reset_index(drop=True)
+
+    def get_many(self, pair_ids: List[str]) -> pd.DataFrame:
+        """
+        Rows of the given pairIDs, preprocessed into the cleaned ESNLIPreprocessor layout.
+        """
+        raw = self.get_raw(pair_ids)
+        raw = raw.reindex(columns=list(raw.columns) + [c for c in RAW_COLUMNS if c not in raw.columns])
+        preprocessor = ESNLIPreprocessor(raw)
+        for stage in PIPELINE_STAGES:
+            getattr(preprocessor, stage)()
+        return preprocessor.cleaned_data
+
+    def get(self, pair_id: str) -> pd.Series:
+        """
+        Row of the given pairID, preprocessed into the cleaned ESNLIPreprocessor layout.
+        """
+        return self.get_many([pair_id]).iloc[0]
+
+
+def main():
+    argparser = ArgumentParser(
+        prog="Indexed reader for e-SNLI splits",
+        description="Index e-SNLI csv files by pairID and fetch single rows without loading the whole split",
+        epilog="LoLa Project"
+    )
+    subparsers = argparser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="index csv files")
+    build_parser.add_argument('csv_files', nargs='+')
+    build_parser.add_argument('-o', '--index', required=True, help="index file to write, e.g. data/esnli_train.idx.npz")
+
+    get_parser = subparsers.add_parser('get', help="print rows as csv")
+    get_parser.add_argument('index')
+    get_parser.add_argument('pair_ids', nargs='*')
+    get_parser.add_argument('--pair-ids-from', help="csv file whose pairID column lists the rows to fetch")
+    get_parser.add_argument('--raw', action='store_true', help="print the raw rows instead of the preprocessed ones")
+    get_parser.add_argument('-o', '--output', help="csv file to write instead of stdout")
+
+    args = argparser.parse_args()
+
+    if args.command == 'build':
+        n_rows = build_index(args.csv_files, args.index)
+        print(f"indexed {n_rows} rows in {args.index}")
+
+    elif args.command == 'get':
+        pair_ids = list(args.pair_ids)
+        if args.pair_ids_from:
+            pair_ids.extend(pd.read_csv(args.pair_ids_from, usecols=['pairID'])['pairID'])
+        with ESNLIIndexReader(args.index) as reader:
+            rows = reader.get_raw(pair_ids) if args.raw else reader.get_many(pair_ids)
+        rows.to_csv(args.output or sys.stdout, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import csv
+import json
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+FORMATS = ('csv', 'jsonl')
+RESULT_FIELDS = ['pairID', 'gold_label'] + [
+    f'Explanation_{n}{suffix}' for n in range(1, 4) for suffix in ('', '_Result', '_Structure')
+]
+
+
+def infer_format(path: str, fmt: Optional[str] = None) -> str:
+    """
+    Format of a file from its extension, '-' (stdin/stdout) defaults to jsonl.
+    """
+    if fmt:
+        return fmt
+    suffix = Path(path).suffix.lower().lstrip('.')
+    if suffix in ('jsonl', 'json', 'ndjson'):
+        return 'jsonl'
+    if suffix == 'csv':
+        return 'csv'
+    if path == '-':
+        return 'jsonl'
+    raise ValueError(f"Cannot infer the format of '{path}', use one of {FORMATS}")
+
+
+@contextmanager
+def _open(path: str, mode: str):
+    if path == '-':
+        yield sys.stdin if 'r' in mode else sys.stdout
+    else:
+        with open(path, mode, encoding='utf-8', newline='') as f:
+            yield f
+
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[dict]:
+    """
+    Lazily read e-SNLI rows as dicts from a csv or jsonl file, '-' reads from stdin.
+
+    Args:
+        path (str): input file or '-'.
+        fmt (str): 'csv' or 'jsonl', inferred from the extension if not given.
+
+    Returns:
+        iterator: one dict per row.
+    """
+    fmt = infer_format(path, fmt)
+    with _open(path, 'r') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class RowWriter:
+    def __init__(self, f, fmt: str, fields: List[str]):
+        """
+        Write result dicts as csv rows (nested values are json encoded) or json lines.
+        """
+        self.f = f
+        self.fmt = fmt
+        self.csv_writer = None
+        if fmt == 'csv':
+            self.csv_writer = csv.DictWriter(f, fieldnames=fields, restval='', extrasaction='ignore')
+            self.csv_writer.writeheader()
+
+    def write(self, row: dict):
+        if self.csv_writer:
+            self.csv_writer.writerow({
+                k: json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v for k, v in row.items()
+            })
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+@contextmanager
+def open_writer(path: str, fmt: Optional[str] = None, fields: List[str] = RESULT_FIELDS) -> Iterator[RowWriter]:
+    """
+    Open a RowWriter on a csv or jsonl file, '-' writes to stdout.
+    """
+    fmt = infer_format(path, fmt)
+    with _open(path, 'w') as f:
+        yield RowWriter(f, fmt, fields)
+        f.flush()
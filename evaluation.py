@@ -0,0 +1,200 @@
+import json
+import warnings
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from patterns.abstract import RELATIONSHIP_SYMBOLS, StructuredExplanation, parse_structured_explanation
+from structuring import LABELS, result_structure
+
+# characters stripped from the gold predicates, as quality_test.ipynb's to_strEx does
+GOLD_STRIP = ' .,!?¬()'
+METRICS = ('precision', 'recall', 'f1')
+
+
+def normalize_gold(text) -> StructuredExplanation:
+    """
+    Parse a gold structured explanation written by the annotators: lowercased, predicates
+    stripped of punctuation, and a '¬' inside a predicate negates its relation, like to_strEx.
+    Missing or malformed gold gives an empty explanation.
+
+    Args:
+        text (str): gold structured explanation, e.g. "¬(car → vehicle) ∧ cat ⊆ animal".
+
+    Returns:
+        StructuredExplanation: the normalized explanation.
+    """
+    if not isinstance(text, str):
+        return StructuredExplanation('', ())
+    try:
+        expl = parse_structured_explanation(text.lower())
+    except ValueError:
+        return StructuredExplanation('', ())
+
+    def normalize(se: StructuredExplanation) -> StructuredExplanation:
+        predicates = tuple(normalize(p) if isinstance(p, StructuredExplanation) else p.strip(GOLD_STRIP) for p in se.predicates)
+        negated = se.negated or (se.relationship != '∧' and any(isinstance(p, str) and '¬' in p for p in se.predicates))
+        return StructuredExplanation(se.relationship, predicates, negated)
+
+    return normalize(expl)
+
+
+def relationships(expl: StructuredExplanation) -> set:
+    """
+    Relationship symbols used in an explanation, '∧' excepted.
+    """
+    found, stack = set(), [expl]
+    while stack:
+        se = stack.pop()
+        if se.relationship and se.relationship != '∧':
+            found.add(se.relationship)
+        stack.extend(p for p in se.predicates if isinstance(p, StructuredExplanation))
+    return found
+
+
+def align(gold: pd.DataFrame, predictions: Iterable[dict], n: int = 1) -> pd.DataFrame:
+    """
+    Align the predicted structures of the n-th explanation with the gold ones by pairID.
+
+    Args:
+        gold (pd.DataFrame): gold set with pairID, gold_label and structured_explanation columns.
+        predictions (iterable): results of structuring.structure_stream or run_structuring.py.
+        n (int): explanation the gold structures were written for.
+
+    Returns:
+        pd.DataFrame: pairID, gold_label, explanation, gold and predicted StructuredExplanations
+        and whether they are equal, for the gold rows with a non empty gold structure.
+    """
+    predicted = {}
+    for result in predictions:
+        predicted[result['pairID']] = result_structure(result, n) or StructuredExplanation('', ())
+
+    missing = set(gold['pairID']) - set(predicted)
+    if missing:
+        raise ValueError(f"No prediction for {len(missing)} gold pairIDs, e.g. {sorted(missing)[:3]}")
+
+    aligned = pd.DataFrame({
+        'pairID': gold['pairID'],
+        'gold_label': gold['gold_label'],
+        'explanation': gold.get(f'Explanation_{n}'),
+        'gold': gold['structured_explanation'].map(normalize_gold),
+        'predicted': gold['pairID'].map(predicted),
+    })
+    aligned = aligned[aligned['gold'].apply(bool)].reset_index(drop=True)
+    aligned['correct'] = [p == g for p, g in zip(aligned['predicted'], aligned['gold'])]
+    return aligned
+
+
+def _count_columns(aligned: pd.DataFrame) -> Tuple[List[str], np.ndarray]:
+    """
+    Indicator matrix (rows x columns) from which every metric is a ratio of column sums: for every
+    group (label or relationship symbol) the true positives counted for precision and for recall,
+    the predictions and the gold structures of the group.
+    """
+    correct = aligned['correct'].to_numpy(dtype=bool)
+    predicted = aligned['predicted'].apply(bool).to_numpy()
+    gold_rels = aligned['gold'].map(relationships)
+    pred_rels = aligned['predicted'].map(relationships)
+
+    groups = {}
+    for label in LABELS:
+        in_label = (aligned['gold_label'] == label).to_numpy()
+        groups[label] = (in_label, in_label & predicted)
+    for symbol in RELATIONSHIP_SYMBOLS[1:]:
+        groups[symbol] = (
+            gold_rels.map(lambda rels: symbol in rels).to_numpy(dtype=bool),
+            pred_rels.map(lambda rels: symbol in rels).to_numpy(dtype=bool),
+        )
+
+    names, columns = [], []
+    for group, (in_gold, in_pred) in groups.items():
+        names.append(group)
+        columns.extend([correct & in_pred, in_pred, correct & in_gold, in_gold])
+    return names, np.stack(columns, axis=1).astype(np.float64)
+
+
+def _metrics(sums: np.ndarray) -> np.ndarray:
+    """
+    precision, recall and f1 from column sums of shape (..., groups * 4), nan when undefined.
+    """
+    sums = sums.reshape(sums.shape[:-1] + (-1, 4))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = sums[..., 0] / sums[..., 1]
+        recall = sums[..., 2] / sums[..., 3]
+        # a correct prediction equals its gold, so both true positive counts are the same and
+        # f1 = 2 tp / (predictions + gold) is defined even without predictions
+        f1 = 2 * sums[..., 2] / (sums[..., 1] + sums[..., 3])
+    return np.stack([precision, recall, f1], axis=-1)
+
+
+@dataclass
+class Estimate:
+    group: str
+    metric: str
+    value: float
+    low: float
+    high: float
+    support: int
+
+
+def evaluate(aligned: pd.DataFrame, resamples: int = 10000, confidence: float = 0.95, seed: Optional[int] = 0) -> List[Estimate]:
+    """
+    Precision, recall and F1 per label and per relationship symbol, with percentile bootstrap
+    confidence intervals. Rows are resampled within each gold label (the gold sets are drawn per
+    label); every resample is a row of multinomial counts, so all metrics of all resamples come
+    from a single matrix product with the indicator columns.
+
+    Args:
+        aligned (pd.DataFrame): output of align.
+        resamples (int): number of bootstrap resamples.
+        confidence (float): level of the intervals.
+        seed (int): seed of the resampling.
+
+    Returns:
+        list: one Estimate per group and metric, groups without gold or predictions are skipped.
+    """
+    names, columns = _count_columns(aligned)
+    rng = np.random.default_rng(seed)
+
+    sums = np.zeros((resamples, columns.shape[1]))
+    for label in aligned['gold_label'].unique():
+        rows = np.flatnonzero((aligned['gold_label'] == label).to_numpy())
+        weights = rng.multinomial(len(rows), np.full(len(rows), 1 / len(rows)), size=resamples)
+        sums += weights @ columns[rows]
+
+    point = _metrics(columns.sum(axis=0))
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # groups with no gold or no prediction in some resamples have undefined metrics there
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanquantile(_metrics(sums), [alpha, 1 - alpha], axis=0)
+    support = columns.sum(axis=0).reshape(-1, 4)[:, 3]
+
+    estimates = []
+    for g, group in enumerate(names):
+        if support[g] == 0 and columns[:, 4 * g + 1].sum() == 0:
+            continue
+        for m, metric in enumerate(METRICS):
+            estimates.append(Estimate(group, metric, float(point[g, m]), float(low[g, m]), float(high[g, m]), int(support[g])))
+    return estimates
+
+
+def format_estimates(estimates: List[Estimate], confidence: float = 0.95) -> str:
+    by_group: Dict[str, Dict[str, Estimate]] = {}
+    for e in estimates:
+        by_group.setdefault(e.group, {})[e.metric] = e
+    level = f"{confidence * 100:g}% CI"
+    lines = [f"{'group':<14} {'support':>7}  " + "  ".join(f"{m:<22}" for m in METRICS) + f"  ({level})"]
+    for group, metrics in by_group.items():
+        cells = []
+        for m in METRICS:
+            e = metrics[m]
+            cells.append(f"{e.value * 100:6.2f} [{e.low * 100:6.2f}, {e.high * 100:6.2f}]" if not np.isnan(e.value) else f"{'-':<22}")
+        support = next(iter(metrics.values())).support
+        lines.append(f"{group:<14} {support:>7}  " + "  ".join(f"{c:<22}" for c in cells))
+    return "\n".join(lines)
+
+
+def to_json(estimates: List[Estimate]) -> str:
+    return json.dumps([{k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in asdict(e).items()} for e in estimates],
+                      indent=2, ensure_ascii=False)
@@ -0,0 +1,328 @@
+import sqlite3
+import sys
+import time
+from argparse import ArgumentParser
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+from esnli_io import read_rows
+from patterns.abstract import StructuredExplanation
+from patterns.columnar import RELATIONSHIPS, encode
+from structuring import N_EXPLANATIONS, result_structure
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY,
+    pairID TEXT NOT NULL UNIQUE,
+    gold_label TEXT
+);
+CREATE TABLE IF NOT EXISTS relationships (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS predicates (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS explanations (
+    id INTEGER PRIMARY KEY,
+    pair INTEGER NOT NULL REFERENCES pairs(id),
+    n INTEGER NOT NULL,
+    text TEXT,
+    result TEXT
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    explanation INTEGER NOT NULL REFERENCES explanations(id),
+    parent INTEGER REFERENCES nodes(id),
+    position INTEGER NOT NULL,
+    relationship INTEGER REFERENCES relationships(id),
+    negated INTEGER NOT NULL,
+    predicate INTEGER REFERENCES predicates(id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS predicates_fts USING fts5(text, content='predicates', content_rowid='id');
+"""
+
+# created after the bulk insert, which is much faster without them
+INDEXES = """
+CREATE INDEX IF NOT EXISTS pairs_gold_label ON pairs(gold_label);
+CREATE INDEX IF NOT EXISTS explanations_pair ON explanations(pair);
+CREATE INDEX IF NOT EXISTS nodes_relationship ON nodes(relationship, negated);
+CREATE INDEX IF NOT EXISTS nodes_parent ON nodes(parent, position);
+CREATE INDEX IF NOT EXISTS nodes_predicate ON nodes(predicate, position);
+CREATE INDEX IF NOT EXISTS nodes_explanation ON nodes(explanation);
+"""
+
+
+class ExplanationStore:
+    def __init__(self, path: Union[str, Path]):
+        """
+        Open (or create) a SQLite store of structured explanations. Every explanation is stored as
+        a tree of nodes, a relationship node pointing to its relationships row and a predicate (leaf)
+        node to its predicates row, with a full text index on the predicates.
+
+        Args:
+            path (str): database file.
+        """
+        self.path = Path(path)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.executescript(SCHEMA)
+        self._relationships = dict(self.connection.execute("SELECT symbol, id FROM relationships"))
+        self._predicates = None
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _relationship_id(self, symbol: str) -> int:
+        if symbol not in self._relationships:
+            # ids follow the codes of patterns.columnar for the known symbols, unless the store
+            # already gave that id to another symbol
+            new_id = RELATIONSHIPS.index(symbol) if symbol in RELATIONSHIPS else -1
+            if new_id < 0 or new_id in self._relationships.values():
+                new_id = max(len(RELATIONSHIPS), *self._relationships.values(), 0) + 1
+            self.connection.execute("INSERT INTO relationships (id, symbol) VALUES (?, ?)", (new_id, symbol))
+            self._relationships[symbol] = new_id
+        return self._relationships[symbol]
+
+    def _predicate_ids(self, texts: List[str]) -> List[int]:
+        if self._predicates is None:
+            self._predicates = dict(self.connection.execute("SELECT text, id FROM predicates"))
+        new = [text for text in dict.fromkeys(texts) if text not in self._predicates]
+        if new:
+            start = self.connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM predicates").fetchone()[0]
+            rows = [(start + i, text) for i, text in enumerate(new)]
+            self.connection.executemany("INSERT INTO predicates (id, text) VALUES (?, ?)", rows)
+            self.connection.executemany("INSERT INTO predicates_fts (rowid, text) VALUES (?, ?)", rows)
+            self._predicates.update((text, i) for i, text in rows)
+        return [self._predicates[text] for text in texts]
+
+    def _next_id(self, table: str) -> int:
+        return self.connection.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}").fetchone()[0]
+
+    def add(self, results: Iterable[dict], batch_size: int = 10000) -> int:
+        """
+        Add structuring results, as written by run_structuring.py, to the store.
+
+        Args:
+            results (iterable): result dicts with pairID, gold_label and Explanation_n,
+                Explanation_n_Result and Explanation_n_Structure for every explanation.
+            batch_size (int): number of results inserted per transaction.
+
+        Returns:
+            int: number of explanations added.
+        """
+        added = 0
+        results = iter(results)
+        while True:
+            batch = list(islice(results, batch_size))
+            if not batch:
+                break
+            with self.connection:
+                added += self._add_batch(batch)
+        return added
+
+    def _add_batch(self, batch: List[dict]) -> int:
+        pair_id = self._next_id('pairs')
+        explanation_id = self._next_id('explanations')
+        node_id = self._next_id('nodes')
+
+        pairs, explanations, structures = [], [], []
+        for result in batch:
+            pairs.append((pair_id, result['pairID'], result.get('gold_label')))
+            for n in range(1, N_EXPLANATIONS + 1):
+                structure = result_structure(result, n)
+                if structure is None:
+                    continue
+                explanations.append((explanation_id + len(explanations), pair_id, n,
+                                     result.get(f'Explanation_{n}'), result.get(f'Explanation_{n}_Result')))
+                structures.append(structure)
+            pair_id += 1
+
+        table = encode(structures)
+        relationship_ids = [self._relationship_id(symbol) for symbol in table.relationships]
+        predicate_ids = self._predicate_ids(table.predicate_strings())
+        relationship_ids.append(None)  # LEAF (-1) codes pick this one
+        predicate_ids.append(None)  # relationship nodes have predicate -1
+        nodes = zip(
+            range(node_id, node_id + len(table.parent)),
+            (table.explanation + explanation_id).tolist(),
+            [node_id + parent if parent >= 0 else None for parent in table.parent.tolist()],
+            table.position.tolist(),
+            [relationship_ids[code] for code in table.relationship.tolist()],
+            table.negated.astype(int).tolist(),
+            [predicate_ids[j] for j in table.predicate.tolist()],
+        )
+
+        self.connection.executemany("INSERT INTO pairs (id, pairID, gold_label) VALUES (?, ?, ?)", pairs)
+        self.connection.executemany("INSERT INTO explanations (id, pair, n, text, result) VALUES (?, ?, ?, ?, ?)", explanations)
+        self.connection.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)", nodes)
+        return len(explanations)
+
+    def create_indexes(self):
+        with self.connection:
+            self.connection.executescript(INDEXES)
+            self.connection.execute("ANALYZE")
+
+    def find(self, relationship: Optional[str] = None, left: Optional[str] = None, right: Optional[str] = None,
+             text: Optional[str] = None, negated: Optional[bool] = None, label: Optional[str] = None,
+             limit: Optional[int] = None) -> List[dict]:
+        """
+        Find the relations (possibly nested in a conjunction) matching all the given criteria.
+
+        Args:
+            relationship (str): relationship symbol, e.g. '⊆'.
+            left (str): exact text of the first predicate.
+            right (str): exact text of the second predicate.
+            text (str): FTS5 query on any predicate of the relation, e.g. 'dog*'.
+            negated (bool): only negated or non negated relations.
+            label (str): gold label of the pair.
+            limit (int): maximum number of rows.
+
+        Returns:
+            list: one dict per matching relation with pairID, gold_label, n, the explanation text,
+            its structured result and the ids of the explanation and of the relation node (see node).
+        """
+        joins, where, params = [], ["r.relationship IS NOT NULL"], []
+        if relationship is not None:
+            if relationship not in self._relationships:
+                return []
+            where.append("r.relationship = ?")
+            params.append(self._relationships[relationship])
+        else:
+            # relations only, not conjunctions or empty explanations
+            where.append("r.relationship NOT IN (SELECT id FROM relationships WHERE symbol IN ('', '∧'))")
+        if negated is not None:
+            where.append("r.negated = ?")
+            params.append(int(negated))
+        for position, value in ((0, left), (1, right)):
+            if value is not None:
+                joins.append(f"JOIN nodes p{position} ON p{position}.parent = r.id AND p{position}.position = {position} "
+                             f"JOIN predicates t{position} ON t{position}.id = p{position}.predicate")
+                where.append(f"t{position}.text = ?")
+                params.append(value)
+        if text is not None:
+            where.append("r.id IN (SELECT c.parent FROM predicates_fts JOIN nodes c ON c.predicate = predicates_fts.rowid "
+                         "WHERE predicates_fts MATCH ?)")
+            params.append(text)
+        if label is not None:
+            where.append("pairs.gold_label = ?")
+            params.append(label)
+
+        query = (
+            "SELECT r.id, e.id, pairs.pairID, pairs.gold_label, e.n, e.text, e.result FROM nodes r "
+            "JOIN explanations e ON e.id = r.explanation JOIN pairs ON pairs.id = e.pair "
+            + " ".join(joins) + " WHERE " + " AND ".join(where) + " ORDER BY r.id"
+        )
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        return [
+            {'pairID': pair_id, 'gold_label': gold_label, 'n': n, 'explanation': explanation_text,
+             'result': result, 'explanation_id': expl_id, 'node_id': node_id}
+            for node_id, expl_id, pair_id, gold_label, n, explanation_text, result in self.connection.execute(query, params)
+        ]
+
+    def node(self, node_id: int) -> Union[str, StructuredExplanation]:
+        """
+        Rebuild the subtree of a node: a predicate string or a StructuredExplanation.
+        """
+        rows = self.connection.execute(
+            "WITH RECURSIVE tree(id) AS (SELECT ? UNION ALL SELECT nodes.id FROM nodes JOIN tree ON nodes.parent = tree.id) "
+            "SELECT nodes.id, nodes.parent, nodes.position, relationships.symbol, nodes.negated, predicates.text "
+            "FROM tree JOIN nodes ON nodes.id = tree.id "
+            "LEFT JOIN relationships ON relationships.id = nodes.relationship "
+            "LEFT JOIN predicates ON predicates.id = nodes.predicate",
+            (node_id,),
+        ).fetchall()
+        if not rows:
+            raise ValueError(f"No node {node_id}")
+        by_id = {row[0]: row for row in rows}
+        children: Dict[int, List[tuple]] = {}
+        for row in rows:
+            children.setdefault(row[1], []).append(row)
+
+        def build(row):
+            if row[3] is None:
+                return row[5]
+            ordered = sorted(children.get(row[0], []), key=lambda child: child[2])
+            return StructuredExplanation(row[3], tuple(build(child) for child in ordered), bool(row[4]))
+
+        return build(by_id[node_id])
+
+    def explanation(self, explanation_id: int) -> StructuredExplanation:
+        """
+        Rebuild a stored explanation.
+        """
+        root = self.connection.execute(
+            "SELECT id FROM nodes WHERE explanation = ? AND parent IS NULL", (explanation_id,)
+        ).fetchone()
+        if root is None:
+            raise ValueError(f"No explanation {explanation_id}")
+        return self.node(root[0])
+
+
+def build_store(results_path: str, store_path: Union[str, Path], fmt: Optional[str] = None) -> int:
+    """
+    Write the results of run_structuring.py to a new store.
+    """
+    with ExplanationStore(store_path) as store:
+        with store.connection:
+            # the store is rebuilt from scratch, so it does not need to survive a crash midway
+            store.connection.execute("PRAGMA journal_mode = OFF")
+            store.connection.execute("PRAGMA synchronous = OFF")
+        added = store.add(read_rows(results_path, fmt))
+        store.create_indexes()
+    return added
+
+
+def main():
+    argparser = ArgumentParser(
+        prog="Structured explanation store for Structured e-SNLI",
+        description="Store structuring results in an indexed SQLite database and query them",
+        epilog="LoLa Project"
+    )
+    subparsers = argparser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="store the results of run_structuring.py")
+    build_parser.add_argument('results', help="csv/jsonl output of run_structuring.py")
+    build_parser.add_argument('-o', '--store', required=True, help="database file to create, e.g. data/structured_test.db")
+    build_parser.add_argument('--format', help="format of the results, defaults to their extension")
+
+    query_parser = subparsers.add_parser('query', help="print the relations matching all the given criteria")
+    query_parser.add_argument('store')
+    query_parser.add_argument('--relationship', help="relationship symbol, e.g. ⊆")
+    query_parser.add_argument('--left', help="exact text of the left predicate")
+    query_parser.add_argument('--right', help="exact text of the right predicate")
+    query_parser.add_argument('--text', help="full text query on the predicates, e.g. 'dog*'")
+    query_parser.add_argument('--negated', action='store_true', default=None, help="only negated relations")
+    query_parser.add_argument('--not-negated', dest='negated', action='store_false', help="only non negated relations")
+    query_parser.add_argument('--label', help="gold label of the pairs")
+    query_parser.add_argument('--limit', type=int, help="maximum number of relations")
+
+    args = argparser.parse_args()
+
+    if args.command == 'build':
+        if Path(args.store).exists():
+            argparser.exit(1, f"error: {args.store} already exists\n")
+        added = build_store(args.results, args.store, args.format)
+        print(f"stored {added} explanations in {args.store}")
+
+    elif args.command == 'query':
+        start = time.perf_counter()
+        with ExplanationStore(args.store) as store:
+            rows = store.find(args.relationship, args.left, args.right, args.text, args.negated, args.label, args.limit)
+            seconds = time.perf_counter() - start
+            for row in rows:
+                print(f"{row['pairID']}\t{row['gold_label']}\t{row['n']}\t{store.node(row['node_id'])}\t{row['result']}")
+        print(f"{len(rows)} relations in {seconds * 1000:.1f}ms", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
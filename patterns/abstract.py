@@ -1,5 +1,8 @@
 from __future__ import annotations
 from .common import *
+from functools import lru_cache
+from spacy.tokens.token import Token
+from . import instrumentation, rules
 
 @dataclass(frozen=True)
 class StructuredExplanation():
@@ -13,14 +16,40 @@ class StructuredExplanation():
     negated: bool = False
 
     def __str__(self):
-        rep = (" " + self.relationship + " ").join([str(p) for p in self.predicates])
+        rep = (" " + self.relationship + " ").join([self._predicate_str(p) for p in self.predicates])
         if self.negated:
             return f'¬({rep})'
         return rep
 
+    def _predicate_str(self, predicate: Union[str, "StructuredExplanation"]) -> str:
+        # nested relations are put in parentheses, except negated ones, which already are, and
+        # any relation inside a "∧": "∧" binds loosest, and a "∧" inside a "∧" prints flat as it
+        # always did, e.g. "a → b ∧ c ⊆ d ∧ e ⊕ f" whatever the nesting of concatenate_explanations
+        if isinstance(predicate, str) or predicate.negated or self.relationship == '∧':
+            return str(predicate)
+        return f'({predicate})'
+
     def __bool__(self):
         return bool(self.relationship) and len(self.predicates) > 0
 
+    def to_dict(self) -> dict:
+        '''
+        json serializable form of the explanation, predicates being strings or nested dicts
+        '''
+        return {
+            'relationship': self.relationship,
+            'predicates': [p.to_dict() if isinstance(p, StructuredExplanation) else p for p in self.predicates],
+            'negated': self.negated,
+        }
+
+    @staticmethod
+    def from_dict(data: dict) -> "StructuredExplanation":
+        return StructuredExplanation(
+            data['relationship'],
+            tuple(StructuredExplanation.from_dict(p) if isinstance(p, dict) else p for p in data['predicates']),
+            data.get('negated', False),
+        )
+
     def __eq__(self, other: object) -> bool:
         """Recursively check both structure and leaves, handling commutativity."""
         if not isinstance(other, StructuredExplanation):
@@ -40,11 +69,193 @@ class StructuredExplanation():
         return all(sp == op for sp, op in zip(self.predicates, other.predicates))
 
 
+RELATIONSHIP_SYMBOLS = ('∧', '↔', '→', '⇒', '⊆', '⊈', '⊕', '⊉')
+_TOKEN_RE = re.compile(r'(¬\s*\(|[' + ''.join(RELATIONSHIP_SYMBOLS) + r']|\(|\))')
+
+
+def _tokenize_explanation(text: str) -> List[Tuple[str, str]]:
+    '''
+    splits a structured explanation string into (kind, text) tokens where kind is one of
+    "¬(" (start of a negated group), "(", ")", "rel" or "text"
+    '''
+    tokens = []
+    for part in _TOKEN_RE.split(text):
+        if not part:
+            continue
+        if part[0] == '¬' and part[-1] == '(':
+            tokens.append(('¬(', part))
+        elif part in ('(', ')'):
+            tokens.append((part, part))
+        elif part in RELATIONSHIP_SYMBOLS:
+            tokens.append(('rel', part))
+        else:
+            tokens.append(('text', part))
+    return tokens
+
+
+class _ExplanationParser():
+    '''
+    Recursive descent parser for the string form of StructuredExplanation:
+
+        expression := relation ("∧" relation)*
+        relation   := operand (REL operand)*       with the same REL throughout
+        operand    := "¬(" expression ")" | "(" expression ")" | predicate
+
+    "∧" chains are nested to the left, like AbstractPattern.concatenate_explanations does.
+    A "(" only opens a group if its content is a relation, e.g. not in "(a dog) ⊆ animal",
+    and a ")" only closes a group if it is not balancing a "(" of the predicate itself.
+    '''
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = _tokenize_explanation(text)
+        self.pos = 0
+        self.depth = 0
+
+    def _peek(self) -> Tuple[str, str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else ('end', '')
+
+    def _skip_space(self):
+        while self._peek()[0] == 'text' and not self._peek()[1].strip():
+            self.pos += 1
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f"{message} in structured explanation '{self.text}'")
+
+    def parse(self) -> StructuredExplanation:
+        expl = self._explanation()
+        self._skip_space()
+        if self.pos < len(self.tokens):
+            raise self._error(f"Unexpected '{self.tokens[self.pos][1]}'")
+        return expl
+
+    def _explanation(self) -> StructuredExplanation:
+        expl = self._expression()
+        if isinstance(expl, str):
+            raise self._error(f"No relationship found for '{expl}'")
+        return expl
+
+    def _expression(self) -> Union[str, StructuredExplanation]:
+        expl = self._relation()
+        self._skip_space()
+        while self._peek() == ('rel', '∧'):
+            self.pos += 1
+            expl = StructuredExplanation('∧', (expl, self._relation()))
+            self._skip_space()
+        return expl
+
+    def _relation(self) -> Union[str, StructuredExplanation]:
+        operands = [self._operand()]
+        relationship = None
+        self._skip_space()
+        while self._peek()[0] == 'rel' and self._peek()[1] != '∧':
+            symbol = self._peek()[1]
+            if relationship is not None and symbol != relationship:
+                raise self._error(f"Ambiguous '{relationship}' and '{symbol}' without parentheses")
+            relationship = symbol
+            self.pos += 1
+            operands.append(self._operand())
+            self._skip_space()
+
+        if relationship is None:
+            # a single operand, only valid as a predicate of a "∧"
+            return operands[0]
+        return StructuredExplanation(relationship, tuple(operands))
+
+    def _group(self) -> StructuredExplanation:
+        self.pos += 1
+        self.depth += 1
+        expl = self._explanation()
+        self._skip_space()
+        if self._peek()[0] != ')':
+            raise self._error("Missing ')'")
+        self.pos += 1
+        self.depth -= 1
+        return expl
+
+    def _operand(self) -> Union[str, StructuredExplanation]:
+        self._skip_space()
+        if self._peek()[0] == '¬(':
+            expl = self._group()
+            if expl.negated:
+                raise self._error("Double negation")
+            return StructuredExplanation(expl.relationship, expl.predicates, negated=True)
+
+        if self._peek()[0] == '(':
+            # a group if its content is a relation, otherwise the "(" belongs to the predicate
+            pos, depth = self.pos, self.depth
+            try:
+                return self._group()
+            except ValueError:
+                self.pos, self.depth = pos, depth
+
+        # parentheses opened inside the predicate itself are closed inside it as well
+        text, open_parens = [], 0
+        while True:
+            kind, part = self._peek()
+            if kind == '(':
+                open_parens += 1
+            elif kind == ')' and (self.depth == 0 or open_parens > 0):
+                open_parens -= 1
+            elif kind != 'text':
+                break
+            text.append(part)
+            self.pos += 1
+        return "".join(text).strip()
+
+
+@lru_cache(maxsize=65536)
+def parse_structured_explanation(text: str) -> StructuredExplanation:
+    '''
+    parses the string form of a StructuredExplanation, e.g. "¬(car → vehicle) ∧ cat ⊆ animal"
+    or "x → (a ⊆ b)". The result round-trips with StructuredExplanation.__str__ for explanations
+    of two or more predicates whose strings are stripped, non empty and hold neither a
+    relationship symbol, "¬(" nor an unbalanced parenthesis, except for the nesting of "∧":
+    a "∧" inside a "∧" prints without parentheses, so "∧" chains of more than two predicates,
+    however nested, parse back to the left nested form of concatenate_explanations.
+    The empty string gives an empty explanation. Results are cached, so repeated strings are
+    only parsed once.
+
+    @param text: structured explanation string
+    @return: StructuredExplanation object
+    '''
+    if not text.strip():
+        return StructuredExplanation('', ())
+    return _ExplanationParser(text).parse()
+
+
+def parse_series(series, errors: str = 'raise'):
+    '''
+    parses a pandas Series of structured explanation strings, every distinct string is parsed once
+
+    @param series: Series of strings, missing values give empty explanations
+    @param errors: 'raise' to propagate parsing errors, 'coerce' to turn them into empty explanations
+    @return: Series of StructuredExplanation objects with the same index
+    '''
+    if errors not in ('raise', 'coerce'):
+        raise ValueError(f"errors must be 'raise' or 'coerce', got '{errors}'")
+
+    def parse(text):
+        if not isinstance(text, str):
+            return StructuredExplanation('', ())
+        try:
+            return parse_structured_explanation(text)
+        except ValueError:
+            if errors == 'raise':
+                raise
+            return StructuredExplanation('', ())
+
+    parsed = {text: parse(text) for text in series.unique()}
+    return series.map(parsed)
+
+
 class AbstractPattern(ABC):
 
     patterns: Dict[str, str]
     relationship: str
     negate: bool = False
+    # names of the rules of patterns.rules.engine whose predicates the class turns into explanations
+    dependency_rules: Tuple[str, ...] = ()
 
     def __call__(self, doc: Doc, highlights: List[str]) -> List[StructuredExplanation]:
         '''
@@ -54,17 +265,26 @@ class AbstractPattern(ABC):
         @param doc: parsed string
         @return: StructuredExplanation object
         '''
-        pattern_tokens = self._find_pattern_tokens(doc)
+        # counters and timings are only recorded while the instrumentation is enabled
+        stats = instrumentation.stats_for(self)
+        stats.calls += 1
+        with stats.timed('_find_pattern_tokens'):
+            pattern_tokens = self._find_pattern_tokens(doc)
+        stats.trigger_matches += len(pattern_tokens)
+
         explanations = []
         for toks in pattern_tokens:
             try:
                 anchor_word = self.patterns.get(str(toks), None)
-                explanations.append(self._generate_structured_explanation(anchor_word, doc, toks, highlights))
+                with stats.timed('_generate_structured_explanation'):
+                    explanations.append(self._generate_structured_explanation(anchor_word, doc, toks, highlights))
             except (IndexError, StopIteration, ValueError) as e:
                 continue
                 # print(f"Error processing: {doc.text}\nError: {e}")
-        extra_expl = self._find_additional_classifications(doc, highlights)
+        with stats.timed('_find_additional_classifications'):
+            extra_expl = self._find_additional_classifications(doc, highlights)
         explanations.extend(extra_expl)
+        stats.explanations += sum(1 for se in explanations if se)
         return AbstractPattern.concatenate_explanations(explanations)
 
     @abstractmethod
@@ -72,7 +292,50 @@ class AbstractPattern(ABC):
         raise NotImplementedError
 
     def _find_additional_classifications(self, doc: Doc, highlights: List[str]) -> List[StructuredExplanation]:
-        return []
+        '''
+        explanations built from the matches of the class' dependency rules
+
+        @param doc: parsed string
+        @return: list of StructuredExplanation objects
+        '''
+        explanations = []
+        if not self.dependency_rules:
+            return explanations
+        for left_term, right_term in rules.engine.apply(doc, self.dependency_rules):
+            left_string = " ".join(tok.text for tok in left_term)
+            right_string = " ".join(tok.text for tok in right_term)
+
+            left_string, right_string = AbstractPattern._get_grounded_terms(left_string, right_string, highlights)
+
+            if not left_string or not right_string:
+                raise ValueError("No grounded terms found")
+
+            explanations.append(StructuredExplanation(self.relationship, [left_string, right_string], self.negate))
+        return explanations
+
+    def _get_trigger_terms(self, anchor_word: str, doc: Doc, pattern_tokens: Span) -> Tuple[List[Token], List[Token]]:
+        '''
+        left and right terms of a trigger span: the left term comes from the head of the anchor
+        token (see rules.left_term), the right one from the subtree of the anchor
+
+        @param anchor_word: word of the trigger the terms are attached to
+        @param pattern_tokens: span of the trigger
+        @return: tokens of the left term, tokens of the right term
+        '''
+        anchor_token = next((tok for tok in pattern_tokens if tok.text == anchor_word), None)
+        if not anchor_token:
+            raise ValueError(f"Anchor token not found in pattern")
+
+        left_term = rules.left_term(doc, anchor_token)
+        if left_term is None:
+            # the anchor is a root, fall back on the tokens on its left
+            left_term = self._get_root_left_term(doc, anchor_token)
+
+        right_term = AbstractPattern._get_right_tokens(anchor_token, pattern_tokens)
+        return left_term, right_term
+
+    def _get_root_left_term(self, doc: Doc, anchor_token: Token) -> List[Token]:
+        return AbstractPattern._get_left_tokens(anchor_token)
 
     def _find_pattern_tokens(self, doc: Doc):
         ## matching all pattern at once and return all spans where it matched
@@ -0,0 +1,317 @@
+from __future__ import annotations
+import json
+from pathlib import Path
+from typing import Iterable, Optional
+import numpy as np
+from .common import *
+from .abstract import RELATIONSHIP_SYMBOLS, StructuredExplanation
+
+# relationship codes, new symbols found while encoding are appended after these. Saved tables
+# store their own relationships in their metadata, so they still decode if the codes change
+RELATIONSHIPS = ('',) + tuple(RELATIONSHIP_SYMBOLS)
+# relationship code of a predicate (leaf) node
+LEAF = -1
+
+NODE_COLUMNS = ('explanation', 'parent', 'position', 'relationship', 'negated', 'predicate')
+VOCAB_COLUMNS = ('predicate_offsets', 'predicate_buffer')
+EXPLANATION_COLUMNS = ('roots', 'labels')
+
+
+@dataclass
+class ExplanationTable():
+    '''
+    Columnar encoding of a batch of structured explanations.
+
+    Every explanation is flattened in pre-order into a node table, where node i is described by
+    explanation[i], parent[i] (-1 for roots), position[i] (index among the parent's predicates),
+    relationship[i] (code into `relationships`, LEAF for predicates), negated[i] and predicate[i]
+    (index into the predicate vocabulary, -1 for relationship nodes).
+    Predicate strings are interned and stored utf-8 encoded in a single buffer, string j being
+    predicate_buffer[predicate_offsets[j]:predicate_offsets[j + 1]].
+    '''
+
+    explanation: np.ndarray
+    parent: np.ndarray
+    position: np.ndarray
+    relationship: np.ndarray
+    negated: np.ndarray
+    predicate: np.ndarray
+    predicate_offsets: np.ndarray
+    predicate_buffer: np.ndarray
+    roots: np.ndarray
+    labels: np.ndarray
+    relationships: Tuple[str, ...] = RELATIONSHIPS
+    label_names: Tuple[str, ...] = ()
+
+    def __len__(self):
+        return len(self.roots)
+
+    @property
+    def node_id(self) -> np.ndarray:
+        return np.arange(len(self.parent), dtype=np.int64)
+
+    @property
+    def n_predicates(self) -> int:
+        return len(self.predicate_offsets) - 1
+
+    def predicate_string(self, j: int) -> str:
+        start, end = self.predicate_offsets[j], self.predicate_offsets[j + 1]
+        return bytes(self.predicate_buffer[start:end]).decode('utf-8')
+
+    def predicate_strings(self) -> List[str]:
+        return [self.predicate_string(j) for j in range(self.n_predicates)]
+
+    def __getitem__(self, i: int) -> StructuredExplanation:
+        return decode(self, i)
+
+
+def encode(explanations: Iterable[Optional[StructuredExplanation]], labels: Optional[Iterable[str]] = None) -> ExplanationTable:
+    '''
+    flattens a batch of structured explanations into an ExplanationTable
+
+    @param explanations: structured explanations, None is encoded as an empty explanation
+    @param labels: optional gold label of every explanation
+    @return: ExplanationTable
+    '''
+    relationships = {rel: code for code, rel in enumerate(RELATIONSHIPS)}
+    vocab: Dict[str, int] = {}
+    explanation, parent, position, relationship, negated, predicate, roots = [], [], [], [], [], [], []
+
+    def add_node(expl_idx, parent_idx, pos, node):
+        node_idx = len(parent)
+        explanation.append(expl_idx)
+        parent.append(parent_idx)
+        position.append(pos)
+        if isinstance(node, StructuredExplanation):
+            relationship.append(relationships.setdefault(node.relationship, len(relationships)))
+            negated.append(node.negated)
+            predicate.append(-1)
+            for child_pos, child in enumerate(node.predicates):
+                add_node(expl_idx, node_idx, child_pos, child)
+        else:
+            relationship.append(LEAF)
+            negated.append(False)
+            predicate.append(vocab.setdefault(str(node), len(vocab)))
+        return node_idx
+
+    for expl_idx, expl in enumerate(explanations):
+        if expl is None:
+            expl = StructuredExplanation('', ())
+        roots.append(add_node(expl_idx, -1, 0, expl))
+
+    encoded = [p.encode('utf-8') for p in vocab]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in encoded], out=offsets[1:])
+
+    label_names: Tuple[str, ...] = ()
+    label_codes = np.full(len(roots), -1, dtype=np.int16)
+    if labels is not None:
+        label_values = list(labels)
+        if len(label_values) != len(roots):
+            raise ValueError(f"Got {len(label_values)} labels for {len(roots)} explanations")
+        label_names, codes = np.unique(np.asarray(label_values, dtype=str), return_inverse=True)
+        label_names = tuple(str(name) for name in label_names)
+        label_codes = codes.astype(np.int16)
+
+    return ExplanationTable(
+        explanation=np.asarray(explanation, dtype=np.int64),
+        parent=np.asarray(parent, dtype=np.int64),
+        position=np.asarray(position, dtype=np.int32),
+        relationship=np.asarray(relationship, dtype=np.int8),
+        negated=np.asarray(negated, dtype=bool),
+        predicate=np.asarray(predicate, dtype=np.int32),
+        predicate_offsets=offsets,
+        predicate_buffer=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        roots=np.asarray(roots, dtype=np.int64),
+        labels=label_codes,
+        relationships=tuple(relationships),
+        label_names=label_names,
+    )
+
+
+def decode(table: ExplanationTable, i: int) -> StructuredExplanation:
+    '''
+    rebuilds the i-th explanation of the table as a StructuredExplanation
+    '''
+    start = int(table.roots[i])
+    end = int(table.roots[i + 1]) if i + 1 < len(table.roots) else len(table.parent)
+    # nodes are stored in pre-order, so children always come after their parent
+    children: Dict[int, List[int]] = {}
+    for node in range(start + 1, end):
+        children.setdefault(int(table.parent[node]), []).append(node)
+
+    def build(node):
+        code = int(table.relationship[node])
+        if code == LEAF:
+            return table.predicate_string(int(table.predicate[node]))
+        return StructuredExplanation(
+            table.relationships[code],
+            tuple(build(child) for child in children.get(node, [])),
+            bool(table.negated[node]),
+        )
+
+    return build(start)
+
+
+def decode_all(table: ExplanationTable) -> List[StructuredExplanation]:
+    return [decode(table, i) for i in range(len(table))]
+
+
+def save_npy(table: ExplanationTable, directory: Union[str, Path]):
+    '''
+    writes every column of the table as a .npy file plus a meta.json, so that it can be
+    memory mapped back with load_npy
+    '''
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for column in NODE_COLUMNS + VOCAB_COLUMNS + EXPLANATION_COLUMNS:
+        np.save(directory / f"{column}.npy", getattr(table, column))
+    meta = {'relationships': list(table.relationships), 'label_names': list(table.label_names)}
+    (directory / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+
+def load_npy(directory: Union[str, Path], mmap: bool = True) -> ExplanationTable:
+    directory = Path(directory)
+    mmap_mode = 'r' if mmap else None
+    columns = {
+        column: np.load(directory / f"{column}.npy", mmap_mode=mmap_mode)
+        for column in NODE_COLUMNS + VOCAB_COLUMNS + EXPLANATION_COLUMNS
+    }
+    meta = json.loads((directory / "meta.json").read_text(encoding="utf-8"))
+    return ExplanationTable(
+        **columns,
+        relationships=tuple(meta['relationships']),
+        label_names=tuple(meta['label_names']),
+    )
+
+
+def _to_arrow(table: ExplanationTable):
+    import pyarrow as pa
+
+    vocab = pa.LargeStringArray.from_buffers(
+        table.n_predicates,
+        pa.py_buffer(np.ascontiguousarray(table.predicate_offsets, dtype=np.int64)),
+        pa.py_buffer(np.ascontiguousarray(table.predicate_buffer)),
+    )
+    # relationship nodes have no predicate, store them as nulls
+    predicate = pa.DictionaryArray.from_arrays(
+        pa.array(table.predicate, mask=table.predicate < 0), vocab
+    )
+    meta = {'relationships': list(table.relationships), 'label_names': list(table.label_names)}
+    return pa.table({
+        'node_id': table.node_id,
+        'explanation': table.explanation,
+        'parent': table.parent,
+        'position': table.position,
+        'relationship': table.relationship,
+        'negated': table.negated,
+        'predicate': predicate,
+        'label': np.asarray(table.labels)[table.explanation],
+    }, metadata={'structured_explanations': json.dumps(meta, ensure_ascii=False)})
+
+
+def _from_arrow(arrow_table) -> ExplanationTable:
+    import pyarrow as pa
+
+    meta = json.loads(arrow_table.schema.metadata[b'structured_explanations'])
+    arrow_table = arrow_table.unify_dictionaries().combine_chunks()
+    column = lambda name: arrow_table.column(name).combine_chunks()
+    numpy = lambda name: column(name).to_numpy(zero_copy_only=False)
+
+    predicate = column('predicate')
+    vocab = predicate.dictionary.cast(pa.large_string())
+    _, offsets, data = vocab.buffers()
+    offsets = np.frombuffer(offsets, dtype=np.int64)[vocab.offset:vocab.offset + len(vocab) + 1]
+    parent = numpy('parent')
+    roots = np.flatnonzero(parent == -1)
+    return ExplanationTable(
+        explanation=numpy('explanation'),
+        parent=parent,
+        position=numpy('position'),
+        relationship=numpy('relationship'),
+        negated=numpy('negated'),
+        predicate=predicate.indices.fill_null(-1).to_numpy().astype(np.int32),
+        predicate_offsets=offsets,
+        predicate_buffer=np.frombuffer(data, dtype=np.uint8) if data is not None else np.zeros(0, dtype=np.uint8),
+        roots=roots,
+        labels=numpy('label')[roots],
+        relationships=tuple(meta['relationships']),
+        label_names=tuple(meta['label_names']),
+    )
+
+
+def save_arrow(table: ExplanationTable, path: Union[str, Path]):
+    '''
+    writes the node table as an Arrow IPC file (memory mappable), requires pyarrow
+    '''
+    import pyarrow as pa
+
+    arrow_table = _to_arrow(table)
+    with pa.OSFile(str(path), 'wb') as sink:
+        with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+
+
+def load_arrow(path: Union[str, Path]) -> ExplanationTable:
+    import pyarrow as pa
+
+    with pa.memory_map(str(path), 'r') as source:
+        return _from_arrow(pa.ipc.open_file(source).read_all())
+
+
+def save_parquet(table: ExplanationTable, path: Union[str, Path]):
+    '''
+    writes the node table as a Parquet file, requires pyarrow
+    '''
+    import pyarrow.parquet as pq
+
+    pq.write_table(_to_arrow(table), str(path))
+
+
+def load_parquet(path: Union[str, Path]) -> ExplanationTable:
+    import pyarrow.parquet as pq
+
+    return _from_arrow(pq.read_table(str(path), memory_map=True))
+
+
+def relationship_histogram(table: ExplanationTable) -> Dict[str, int]:
+    '''
+    counts the relationship nodes of every type, empty explanations are not counted
+    '''
+    codes = np.asarray(table.relationship)
+    counts = np.bincount(codes[codes > 0], minlength=len(table.relationships))
+    return {rel: int(counts[code]) for code, rel in enumerate(table.relationships) if code > 0 and counts[code]}
+
+
+def predicate_frequency(table: ExplanationTable, top: Optional[int] = None) -> List[Tuple[str, int]]:
+    '''
+    counts how often every predicate string occurs, most frequent first
+    '''
+    predicate = np.asarray(table.predicate)
+    counts = np.bincount(predicate[predicate >= 0], minlength=table.n_predicates)
+    order = np.argsort(-counts, kind='stable')
+    if top is not None:
+        order = order[:top]
+    return [(table.predicate_string(int(j)), int(counts[j])) for j in order if counts[j]]
+
+
+def covered(table: ExplanationTable) -> np.ndarray:
+    '''
+    boolean mask of the explanations that have a non empty structure
+    '''
+    roots = np.asarray(table.roots)
+    ends = np.append(roots[1:], len(table.parent))
+    # an explanation is covered if its root is a relationship with at least one predicate
+    return (np.asarray(table.relationship)[roots] > 0) & (ends - roots > 1)
+
+
+def coverage_by_label(table: ExplanationTable) -> Dict[str, float]:
+    '''
+    proportion of explanations with a non empty structure for every label
+    '''
+    labels = np.asarray(table.labels)
+    if not table.label_names:
+        raise ValueError("The table was encoded without labels")
+    total = np.bincount(labels[labels >= 0], minlength=len(table.label_names))
+    hits = np.bincount(labels[(labels >= 0) & covered(table)], minlength=len(table.label_names))
+    return {name: float(hits[code] / total[code]) if total[code] else 0.0 for code, name in enumerate(table.label_names)}
@@ -0,0 +1,159 @@
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+TIMED_METHODS = ('_find_pattern_tokens', '_generate_structured_explanation', '_find_additional_classifications')
+METRIC_PREFIX = 'structured_esnli_pattern'
+
+
+@dataclass
+class PatternStats():
+    '''
+    Counters of one pattern class: calls of __call__, spans matching one of its patterns,
+    non empty explanations produced, exceptions raised by the timed methods by type and
+    cumulative time per method
+    '''
+
+    calls: int = 0
+    trigger_matches: int = 0
+    explanations: int = 0
+    exceptions: Counter = field(default_factory=Counter)
+    seconds: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(TIMED_METHODS, 0.0))
+
+    @contextmanager
+    def timed(self, method: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.exceptions[type(e).__name__] += 1
+            raise
+        finally:
+            self.seconds[method] += time.perf_counter() - start
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'trigger_matches': self.trigger_matches,
+            'explanations': self.explanations,
+            'exceptions': dict(self.exceptions),
+            'seconds': dict(self.seconds),
+        }
+
+
+class NullStats():
+    '''
+    Stand-in for PatternStats while the instrumentation is disabled, recording nothing
+    '''
+
+    calls = trigger_matches = explanations = property(lambda self: 0, lambda self, value: None)
+    _untimed = nullcontext()
+
+    def timed(self, method: str):
+        return self._untimed
+
+
+NULL_STATS = NullStats()
+
+
+class PatternInstrumentation():
+    '''
+    Collects PatternStats for every pattern class while it is enabled, see instrument()
+    '''
+
+    def __init__(self):
+        self.stats: Dict[str, PatternStats] = {}
+
+    def stats_for(self, pattern) -> PatternStats:
+        name = type(pattern).__name__
+        if name not in self.stats:
+            self.stats[name] = PatternStats()
+        return self.stats[name]
+
+    def reset(self):
+        self.stats.clear()
+
+    def to_dict(self) -> Dict[str, dict]:
+        return {name: stats.to_dict() for name, stats in sorted(self.stats.items())}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self) -> str:
+        '''
+        formats the counters in the Prometheus text exposition format
+        '''
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_str}}} {value}")
+
+        items = sorted(self.stats.items())
+        metric("calls_total", "Number of calls of the pattern class.",
+               [({'pattern': n}, s.calls) for n, s in items])
+        metric("trigger_matches_total", "Number of spans matching one of the patterns of the class.",
+               [({'pattern': n}, s.trigger_matches) for n, s in items])
+        metric("explanations_total", "Number of non empty structured explanations produced.",
+               [({'pattern': n}, s.explanations) for n, s in items])
+        metric("exceptions_total", "Number of exceptions raised by the timed methods of the pattern class.",
+               [({'pattern': n, 'exception': e}, c) for n, s in items for e, c in sorted(s.exceptions.items())])
+        metric("seconds_total", "Cumulative time spent in the methods of the pattern class.",
+               [({'pattern': n, 'method': m}, f"{t:.6f}") for n, s in items for m, t in s.seconds.items()])
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Union[str, Path]):
+        '''
+        writes the counters as Prometheus text if the file ends with .prom, as json otherwise
+        '''
+        path = Path(path)
+        path.write_text(self.to_prometheus() if path.suffix == '.prom' else self.to_json())
+
+
+_active: Optional[PatternInstrumentation] = None
+
+
+def active() -> Optional[PatternInstrumentation]:
+    return _active
+
+
+def stats_for(pattern) -> Union[PatternStats, NullStats]:
+    '''
+    stats of the pattern class in the active instrumentation, NULL_STATS if there is none
+    '''
+    return _active.stats_for(pattern) if _active is not None else NULL_STATS
+
+
+def enable(instrumentation: Optional[PatternInstrumentation] = None) -> PatternInstrumentation:
+    global _active
+    _active = instrumentation or PatternInstrumentation()
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+@contextmanager
+def instrument() -> Iterator[PatternInstrumentation]:
+    '''
+    enables the instrumentation of every pattern call inside the with block
+
+        with instrument() as stats:
+            pattern(doc, highlights)
+        print(stats.to_prometheus())
+    '''
+    previous = _active
+    instrumentation = enable()
+    try:
+        yield instrumentation
+    finally:
+        enable(previous) if previous else disable()
@@ -0,0 +1,164 @@
+from .common import *
+from spacy.matcher import DependencyMatcher
+from spacy.tokens.token import Token
+from typing import Any, Callable, Iterable, Optional
+
+# key of the matches cached in doc.user_data, so that all pattern classes share one matcher pass
+USER_DATA_KEY = 'structured_esnli.rule_matches'
+
+Predicates = Tuple[List[Token], List[Token]]
+
+
+@dataclass(frozen=True)
+class DependencyRule():
+    '''
+    Declarative dependency rule: `pattern` is a DependencyMatcher pattern, whose nodes are named by
+    their RIGHT_ID, and `build` turns the matched tokens (node name -> token) into what the rule
+    produces, e.g. the token lists of the left and right predicates, or None to discard the match
+    '''
+
+    name: str
+    pattern: Tuple[Dict, ...]
+    build: Optional[Callable[[Doc, Dict[str, Token]], Any]] = None
+
+    @property
+    def nodes(self) -> List[str]:
+        return [node['RIGHT_ID'] for node in self.pattern]
+
+
+class RuleEngine():
+    '''
+    Compiles dependency rules into a single DependencyMatcher, run once per doc for every rule
+    and every pattern class: structuring.structure runs it before the pattern classes, which
+    then read the matches cached on the doc. Rules can be added at any time, cached matches of
+    older docs are then recomputed.
+    '''
+
+    def __init__(self, vocab):
+        self.matcher = DependencyMatcher(vocab)
+        self.rules: Dict[str, DependencyRule] = {}
+        self.version = 0
+
+    def add(self, rule: DependencyRule):
+        if rule.name in self.rules:
+            self.matcher.remove(rule.name)
+        self.matcher.add(rule.name, [list(rule.pattern)])
+        self.rules[rule.name] = rule
+        self.version += 1
+
+    def matches(self, doc: Doc) -> Dict[str, List[Tuple[int, ...]]]:
+        '''
+        matches of every rule in the doc, as token indices in the order of the rule's nodes,
+        sorted by position. Token indices rather than tokens are cached, so that docs can still
+        be serialized
+
+        @param doc: parsed string
+        @return: rule name -> list of matches
+        '''
+        cached = doc.user_data.get(USER_DATA_KEY)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+
+        found = {name: [] for name in self.rules}
+        # rules are about the dependency parse, without it nothing can match
+        if doc.has_annotation("DEP"):
+            for match_id, token_ids in self.matcher(doc):
+                found[self.matcher.vocab.strings[match_id]].append(tuple(token_ids))
+        for name in found:
+            found[name].sort()
+        doc.user_data[USER_DATA_KEY] = (self.version, found)
+        return found
+
+    def match_tokens(self, doc: Doc, name: str) -> List[Dict[str, Token]]:
+        '''
+        matches of one rule, as node name -> token
+        '''
+        nodes = self.rules[name].nodes
+        return [{node: doc[i] for node, i in zip(nodes, match)} for match in self.matches(doc)[name]]
+
+    def apply(self, doc: Doc, names: Iterable[str]) -> list:
+        '''
+        builds every match of the given rules, in rule and then doc order, leaving out the
+        discarded ones
+        '''
+        built = []
+        for name in names:
+            build = self.rules[name].build
+            for tokens in self.match_tokens(doc, name):
+                value = build(doc, tokens)
+                if value is not None:
+                    built.append(value)
+        return built
+
+
+def _first_child(head: Token, deps: Iterable[str]) -> Optional[Token]:
+    return next((child for child in head.children if child.dep_ in deps), None)
+
+
+# words of the complement that are already handled by the trigger based patterns
+IS_A_FORBIDDEN = {"rephrasing", "rephrase", "synonym", "equivalent", "type", "kind", "sort", "form", "same", "exchanged"}
+
+
+def _build_is_a(doc: Doc, tokens: Dict[str, Token]) -> Optional[Predicates]:
+    verb, subj, comp = tokens['verb'], tokens['subject'], tokens['complement']
+    # only the first subject and the first complement of the verb are considered
+    if _first_child(verb, ("nsubj",)) != subj or _first_child(verb, ("attr", "acomp")) != comp:
+        return None
+    comp_text = " ".join(tok.lemma_.lower() for tok in comp.subtree)
+    if any(word in comp_text for word in IS_A_FORBIDDEN):
+        return None
+    return list(subj.subtree), list(comp.subtree)
+
+
+# "X is a Y": a ROOT form of "be" with a noun subject and a noun attribute or complement
+IS_A = DependencyRule(
+    name='is_a',
+    pattern=(
+        {'RIGHT_ID': 'verb', 'RIGHT_ATTRS': {'LEMMA': 'be', 'DEP': 'ROOT'}},
+        {'LEFT_ID': 'verb', 'REL_OP': '>', 'RIGHT_ID': 'subject',
+         'RIGHT_ATTRS': {'DEP': 'nsubj', 'POS': {'IN': ['NOUN', 'PROPN']}}},
+        {'LEFT_ID': 'verb', 'REL_OP': '>', 'RIGHT_ID': 'complement',
+         'RIGHT_ATTRS': {'DEP': {'IN': ['attr', 'acomp']}, 'POS': {'IN': ['NOUN', 'PROPN']}}},
+    ),
+    build=_build_is_a,
+)
+
+
+def _build_head_left_child(doc: Doc, tokens: Dict[str, Token]) -> Tuple[int, List[Token]]:
+    return tokens['head'].i, list(tokens['left'].subtree)
+
+
+# non punctuation children on the left of a token, the first one under the head of a trigger's
+# anchor gives the trigger's left term, e.g. [the dog] is a type of animal
+HEAD_LEFT_CHILD = DependencyRule(
+    name='head_left_child',
+    pattern=(
+        {'RIGHT_ID': 'head', 'RIGHT_ATTRS': {}},
+        {'LEFT_ID': 'head', 'REL_OP': '>--', 'RIGHT_ID': 'left', 'RIGHT_ATTRS': {'IS_PUNCT': False}},
+    ),
+    build=_build_head_left_child,
+)
+
+engine = RuleEngine(nlp.vocab)
+engine.add(IS_A)
+engine.add(HEAD_LEFT_CHILD)
+
+
+def left_term(doc: Doc, anchor_token: Token) -> Optional[List[Token]]:
+    '''
+    left term of a trigger anchored on anchor_token: the subtree of the first head_left_child
+    match under its head, or all the left children of the head if there is none
+
+    @param doc: parsed string
+    @param anchor_token: anchor token of the trigger
+    @return: list of tokens, None if the anchor is a root
+    '''
+    head = anchor_token.head
+    if head == anchor_token:
+        return None
+    nodes = HEAD_LEFT_CHILD.nodes
+    # matches are sorted, the first one of the head has its leftmost child
+    match = next((m for m in engine.matches(doc)[HEAD_LEFT_CHILD.name] if m[0] == head.i), None)
+    if match is None:
+        return list(head.lefts)
+    return HEAD_LEFT_CHILD.build(doc, {node: doc[i] for node, i in zip(nodes, match)})[1]
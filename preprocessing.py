@@ -3,6 +3,18 @@ import string
 import pandas as pd
 import spacy 
 
+# stages run by run_preprocessing.py, in order
+PIPELINE_STAGES = [
+    'extract_highlighted_words',
+    'add_sentence_lengths',
+    'count_highlighted_words',
+    'create_ordered_highlights_as_list',
+    'cleanup_and_restructure',
+]
+# highlighted word indices such as "3,4,5" must be read as strings, even from a chunk of the
+# file where every row has a single index
+HIGHLIGHT_DTYPES = {f'Sentence{s}_Highlighted_{i}': str for i in range(1, 4) for s in (1, 2)}
+
 class ESNLIPreprocessor:
     def __init__(self, data, csv_path=""):
         """
@@ -14,7 +26,16 @@ class ESNLIPreprocessor:
         """
         self.data = data
         self.cleaned_data = pd.DataFrame()
-        self.nlp = spacy.load("en_core_web_sm")
+        self._nlp = None
+
+    @property
+    def nlp(self):
+        """
+        spaCy model, only loaded when needed (lemmatize_highlighted_words).
+        """
+        if self._nlp is None:
+            self._nlp = spacy.load("en_core_web_sm")
+        return self._nlp
 
     def extract_highlighted_words(self):
         """
@@ -33,7 +54,8 @@ class ESNLIPreprocessor:
 
         return self.data
 
-    def _extract_ordered_highlighted_phrases(self, text):
+    @staticmethod
+    def _extract_ordered_highlighted_phrases(text):
         """
         Scans a 'marked' sentence (e.g., "This church *choir* *sings* …")
         for highlighted substrings in order.
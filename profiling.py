@@ -0,0 +1,78 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Iterator, List
+
+
+@dataclass
+class StageProfile:
+    """
+    Profile of one pipeline stage: wall-clock seconds, peak traced memory during the stage,
+    net memory allocated by the stage and memory still traced once it finished.
+    """
+
+    name: str
+    seconds: float
+    peak_bytes: int
+    allocated_bytes: int
+    current_bytes: int
+
+
+class StageProfiler:
+    def __init__(self, enabled: bool = True):
+        """
+        Initialize the profiler, tracemalloc is started on the first profiled stage.
+
+        Args:
+            enabled (bool): when False, stage() does nothing and no memory is traced.
+        """
+        self.enabled = enabled
+        self.stages: List[StageProfile] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Profile the code inside the with block as the stage `name`.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            self.stages.append(StageProfile(name, seconds, peak, current - before, current))
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def format_table(self) -> str:
+        """
+        Format the stage profiles as a plain text table, memory in MiB.
+        """
+        header = f"{'stage':<36} {'seconds':>10} {'peak (MiB)':>11} {'allocated (MiB)':>16} {'current (MiB)':>14}"
+        lines = [header, "-" * len(header)]
+        mib = lambda n: n / 2**20
+        for s in self.stages:
+            lines.append(
+                f"{s.name:<36} {s.seconds:>10.3f} {mib(s.peak_bytes):>11.2f} {mib(s.allocated_bytes):>16.2f} {mib(s.current_bytes):>14.2f}"
+            )
+        total = sum(s.seconds for s in self.stages)
+        peak = max((s.peak_bytes for s in self.stages), default=0)
+        lines.append("-" * len(header))
+        lines.append(f"{'total':<36} {total:>10.3f} {mib(peak):>11.2f}")
+        return "\n".join(lines)
+
+    def write_json(self, path: Path):
+        path.write_text(json.dumps([asdict(s) for s in self.stages], indent=2))
@@ -0,0 +1,106 @@
+import json
+import time
+import pandas as pd
+from argparse import ArgumentParser
+from dataclasses import asdict
+from pathlib import Path
+from preprocessing import HIGHLIGHT_DTYPES
+from sampling import StratifiedSampler, allocate, length_bins, stratified_estimate
+from sharding import is_covered
+from structuring import LABELS, build_pattern_sets, structure_stream
+from workers import StructuringPool
+
+
+def _format(estimates) -> str:
+    lines = [f"{'group':<14} {'coverage':>9}  {'interval':<18} {'sampled':>10} / population"]
+    for e in estimates:
+        lines.append(f"{e.group:<14} {e.coverage * 100:8.2f}%  [{e.low * 100:6.2f}, {e.high * 100:6.2f}]  {e.sampled:>10} / {e.population}")
+    return "\n".join(lines)
+
+
+def main():
+
+    argparser = ArgumentParser(
+        prog="Coverage Estimation for Structured e-SNLI",
+        description="Compute the coverage of the patterns per label like eval.ipynb, exactly or from a stratified sample",
+        epilog="LoLa Project"
+    )
+    argparser.add_argument('filename', help="raw or cleaned e-SNLI csv file")
+    argparser.add_argument('--sample', type=int, help="structure only this many rows per label (initial sample with --margin)")
+    argparser.add_argument('--margin', type=float, help="keep doubling the sample of a label until its interval is within +/- this margin, e.g. 0.01")
+    argparser.add_argument('--length-bins', type=int, default=1, help="also stratify by quantile bins of the first explanation's length")
+    argparser.add_argument('--confidence', type=float, default=0.95, help="level of the Wilson intervals")
+    argparser.add_argument('--seed', type=int, default=0, help="seed of the sample")
+    argparser.add_argument('--batch-size', type=int, default=256, help="number of rows parsed together")
+    argparser.add_argument('--workers', type=int, default=1, help="number of worker processes")
+    argparser.add_argument('--json', type=Path, help="also write the estimates to this json file")
+
+    args = argparser.parse_args()
+
+    if args.sample is not None and args.sample < 1:
+        argparser.error("--sample must be at least 1")
+    if args.margin is not None and not args.sample:
+        argparser.error("--margin needs an initial --sample size")
+
+    start = time.perf_counter()
+    data = pd.read_csv(args.filename, dtype=HIGHLIGHT_DTYPES)
+    data = data[data['gold_label'].isin(LABELS)].reset_index(drop=True)
+    if data.empty:
+        argparser.error(f"{args.filename} has no rows labelled {', '.join(LABELS)}")
+    lengths = data['Explanation_1'].fillna('').astype(str).str.split().str.len()
+    bins = length_bins(lengths, args.length_bins)
+    strata = data['gold_label'].astype(str) + ':' + bins.astype(str)
+    label_of = dict(zip(strata, data['gold_label']))
+
+    sampler = StratifiedSampler(strata, args.seed)
+    sizes = sampler.sizes
+    label_sizes = {label: {s: n for s, n in sizes.items() if label_of[s] == label} for label in LABELS}
+    per_label = {label: args.sample or sum(strata_sizes.values()) for label, strata_sizes in label_sizes.items()}
+    covered = dict.fromkeys(sizes, 0)
+    estimates = {}
+
+    pattern_sets = build_pattern_sets()
+    pool = StructuringPool(args.workers, pattern_sets, args.batch_size) if args.workers > 1 else None
+    try:
+        while True:
+            targets = {}
+            for label, n in per_label.items():
+                if label_sizes[label]:
+                    targets.update(allocate(n, label_sizes[label]))
+            new = sampler.grow(targets)
+            if not len(new):
+                break
+
+            rows = data.iloc[new].to_dict('records')
+            results = pool.imap(rows) if pool else structure_stream(rows, pattern_sets, args.batch_size)
+            for stratum, result in zip(strata.iloc[new], results):
+                covered[stratum] += is_covered(result)
+
+            estimates = {
+                label: stratified_estimate(label, covered, sampler.taken, strata_sizes, args.confidence)
+                for label, strata_sizes in label_sizes.items() if strata_sizes
+            }
+            print(f"[{time.perf_counter() - start:7.1f}s] " + ", ".join(
+                f"{label} {e.coverage * 100:.2f}% ±{e.margin * 100:.2f} (n={e.sampled})" for label, e in estimates.items()
+            ))
+            if args.margin is None:
+                break
+            pending = [label for label, e in estimates.items() if e.margin > args.margin and e.sampled < e.population]
+            if not pending:
+                break
+            for label in pending:
+                per_label[label] *= 2
+    finally:
+        if pool is not None:
+            pool.close()
+
+    estimates = list(estimates.values())
+    estimates.append(stratified_estimate('all', covered, sampler.taken, sizes, args.confidence))
+    print(_format(estimates))
+
+    if args.json:
+        args.json.write_text(json.dumps([asdict(e) for e in estimates], indent=2))
+
+
+if __name__ == '__main__':
+    main()
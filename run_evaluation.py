@@ -0,0 +1,55 @@
+import time
+import pandas as pd
+from argparse import ArgumentParser
+from pathlib import Path
+from esnli_io import read_rows
+from evaluation import align, evaluate, format_estimates, to_json
+from structuring import build_pattern_sets, structure_stream
+from workers import StructuringPool
+
+
+def main():
+
+    argparser = ArgumentParser(
+        prog="Quality Evaluation for Structured e-SNLI",
+        description="Compare the structured explanations of all labels with the manually written ones, with bootstrap confidence intervals",
+        epilog="LoLa Project"
+    )
+    argparser.add_argument('gold', nargs='?', default="data/assigned_samples_training.csv",
+                           help="e-SNLI rows with a structured_explanation column for their first explanation")
+    argparser.add_argument('--predictions', help="results of run_structuring.py on the gold rows, structured now if not given")
+    argparser.add_argument('--workers', type=int, default=1, help="number of worker processes structuring the gold rows")
+    argparser.add_argument('--batch-size', type=int, default=64, help="number of rows parsed together")
+    argparser.add_argument('--resamples', type=int, default=10000, help="number of bootstrap resamples")
+    argparser.add_argument('--confidence', type=float, default=0.95, help="level of the confidence intervals")
+    argparser.add_argument('--seed', type=int, default=0, help="seed of the bootstrap")
+    argparser.add_argument('--json', type=Path, help="also write the estimates to this json file")
+    argparser.add_argument('--details', type=Path, help="write the aligned gold and predicted structures to this csv file")
+
+    args = argparser.parse_args()
+
+    gold = pd.read_csv(args.gold)
+    if args.predictions:
+        predictions = list(read_rows(args.predictions))
+    elif args.workers > 1:
+        with StructuringPool(args.workers, batch_size=args.batch_size) as pool:
+            predictions = list(pool.imap(gold.to_dict('records')))
+    else:
+        predictions = list(structure_stream(gold.to_dict('records'), build_pattern_sets(), args.batch_size))
+
+    aligned = align(gold, predictions)
+    start = time.perf_counter()
+    estimates = evaluate(aligned, args.resamples, args.confidence, args.seed)
+    seconds = time.perf_counter() - start
+
+    print(format_estimates(estimates, args.confidence))
+    print(f"{len(aligned)} rows with a gold structure, {args.resamples} resamples in {seconds:.3f}s")
+
+    if args.json:
+        args.json.write_text(to_json(estimates))
+    if args.details:
+        aligned.assign(gold=aligned['gold'].map(str), predicted=aligned['predicted'].map(str)).to_csv(args.details, index=False)
+
+
+if __name__ == '__main__':
+    main()
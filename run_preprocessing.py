@@ -1,4 +1,8 @@
-from preprocessing import ESNLIPreprocessor
+from preprocessing import ESNLIPreprocessor, HIGHLIGHT_DTYPES, PIPELINE_STAGES
+from profiling import StageProfiler
+from checkpoint import ShardedRun, fingerprint, source_fingerprint
+from sharding import input_identity
+import preprocessing
 import pandas as pd
 from argparse import ArgumentParser
 from pathlib import Path
@@ -11,6 +15,56 @@ def _extract_path(f: str) -> Tuple[Path, str]:
     return path, name
 
 
+def _preprocess(df: pd.DataFrame, profiler: StageProfiler, prefix: str = "") -> ESNLIPreprocessor:
+    with profiler.stage(prefix + "init_preprocessor"):
+        preprocessor = ESNLIPreprocessor(df)
+    for stage in PIPELINE_STAGES:
+        with profiler.stage(prefix + stage):
+            getattr(preprocessor, stage)()
+    return preprocessor
+
+
+def _write(preprocessor: ESNLIPreprocessor, preprocessed_path: Path, cleaned_path: Path, profiler: StageProfiler, prefix: str = ""):
+    with profiler.stage(prefix + "write_preprocessed_csv"):
+        preprocessor.data.to_csv(preprocessed_path, index=False)
+    with profiler.stage(prefix + "write_cleaned_csv"):
+        preprocessor.cleaned_data.to_csv(cleaned_path, index=False)
+
+
+def _run_sharded(args, path: Path, name: str, profiler: StageProfiler):
+    """
+    Preprocess the file shard_size rows at a time, each shard being written with its manifest,
+    then merge the shards into the usual preprocessed_/cleaned_ files.
+    """
+    # the shards of a regenerated input file must not be reused, even with the same row count
+    source = input_identity(args.filename)
+    run = ShardedRun(
+        args.output_dir or path / (name + ".shards"),
+        fingerprint(source_fingerprint(preprocessing.__file__), pd.__version__, source['size'], source['digest']),
+        ['preprocessed.csv', 'cleaned.csv'],
+        resume=args.resume,
+        source=source,
+    )
+
+    start, n_shards = 0, 0
+    for i, chunk in enumerate(pd.read_csv(args.filename, chunksize=args.shard_size, dtype=HIGHLIGHT_DTYPES)):
+        stop = start + len(chunk)
+        if run.is_complete(i, start, stop):
+            print(f"shard {i} (rows {start}-{stop}) already complete, skipping")
+        else:
+            with run.shard(i, start, stop) as files:
+                prefix = f"shard-{i:05d}."
+                preprocessor = _preprocess(chunk, profiler, prefix)
+                _write(preprocessor, files['preprocessed.csv'], files['cleaned.csv'], profiler, prefix)
+        start, n_shards = stop, i + 1
+
+    with profiler.stage("merge_shards"):
+        run.merge(n_shards, {
+            'preprocessed.csv': path / ("preprocessed_" + name),
+            'cleaned.csv': path / ("cleaned_" + name),
+        })
+
+
 def main():
 
     argparser = ArgumentParser(
@@ -19,22 +73,33 @@ def main():
         epilog="LoLa Project"
     )
     argparser.add_argument('filename')
+    argparser.add_argument('--profile', action='store_true', help="print wall-clock time and memory of every stage")
+    argparser.add_argument('--profile-json', type=Path, help="also write the profile to this json file (implies --profile)")
+    argparser.add_argument('--shard-size', type=int, help="preprocess the file in shards of this many rows, with a manifest per shard")
+    argparser.add_argument('--output-dir', type=Path, help="directory of the shards, defaults to <filename>.shards")
+    argparser.add_argument('--resume', action='store_true', help="keep the shards completed by a previous run and redo the others")
 
     args = argparser.parse_args()
 
-    path, name = _extract_path(args.filename)
+    if args.resume and not args.shard_size:
+        argparser.error("--resume needs --shard-size")
 
-    df = pd.read_csv(args.filename)
+    path, name = _extract_path(args.filename)
+    profiler = StageProfiler(enabled=args.profile or args.profile_json is not None)
 
-    preprocessor = ESNLIPreprocessor(df)
-    preprocessed_data = preprocessor.extract_highlighted_words()
-    preprocessed_data = preprocessor.add_sentence_lengths()
-    preprocessed_data = preprocessor.count_highlighted_words()
-    preprocessed_data = preprocessor.create_ordered_highlights_as_list()
-    cleaned_data = preprocessor.cleanup_and_restructure()
+    if args.shard_size:
+        _run_sharded(args, path, name, profiler)
+    else:
+        with profiler.stage("read_csv"):
+            df = pd.read_csv(args.filename, dtype=HIGHLIGHT_DTYPES)
+        preprocessor = _preprocess(df, profiler)
+        _write(preprocessor, path / ("preprocessed_" + name), path / ("cleaned_" + name), profiler)
 
-    preprocessor.data.to_csv(path / ("preprocessed_" + name), index=False)
-    preprocessor.cleaned_data.to_csv(path / ("cleaned_" + name), index=False)
+    if profiler.enabled:
+        profiler.stop()
+        print(profiler.format_table())
+        if args.profile_json:
+            profiler.write_json(args.profile_json)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+from argparse import ArgumentParser, ArgumentTypeError
+from itertools import islice
+from pathlib import Path
+from checkpoint import ShardedRun, fingerprint
+from esnli_io import FORMATS, infer_format, open_writer, read_rows
+from patterns import instrumentation
+from sharding import input_identity, parse_shard_spec, select_shard, write_shard_manifest
+from structuring import build_pattern_sets, pattern_fingerprint, structure_stream
+from workers import START_METHODS, StructuringPool
+
+
+def _read_input(args):
+    rows = read_rows(args.input, args.input_format)
+    if args.shard:
+        rows = select_shard(rows, *args.shard)
+    return rows
+
+
+def _structure(rows, pattern_sets, args, pool):
+    if pool is not None:
+        return pool.imap(rows)
+    return structure_stream(rows, pattern_sets, args.batch_size)
+
+
+def _run_sharded(args, pattern_sets, pool):
+    """
+    Structure the input shard_size rows at a time, each shard being written with its manifest,
+    then merge the shards into the output file.
+    """
+    fmt = infer_format(args.output, args.output_format)
+    output_name = f"results.{fmt}"
+    # the shards of a regenerated input file must not be reused, even with the same row count
+    source = input_identity(args.input)
+    run = ShardedRun(
+        args.output_dir or Path(args.output + ".shards"),
+        # a --shard i/N run must not resume from the checkpoints of another hash shard
+        fingerprint(pattern_fingerprint(pattern_sets), args.shard, source['size'], source['digest']),
+        [output_name],
+        resume=args.resume,
+        source=source,
+    )
+
+    rows = _read_input(args)
+    i, start = 0, 0
+    while True:
+        chunk = list(islice(rows, args.shard_size))
+        # an empty input still gets one empty shard, so that a csv output has its header
+        if not chunk and i > 0:
+            break
+        stop = start + len(chunk)
+        if run.is_complete(i, start, stop):
+            print(f"shard {i} (rows {start}-{stop}) already complete, skipping")
+        else:
+            with run.shard(i, start, stop) as files, open_writer(str(files[output_name]), fmt) as writer:
+                for result in _structure(chunk, pattern_sets, args, pool):
+                    writer.write(result)
+        i, start = i + 1, stop
+        if not chunk:
+            break
+
+    run.merge(i, {output_name: args.output})
+
+
+def _shard_spec(spec: str):
+    try:
+        return parse_shard_spec(spec)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+
+
+def main():
+
+    argparser = ArgumentParser(
+        prog="Structuring Pipeline for Structured e-SNLI",
+        description="Stream e-SNLI rows from a csv or jsonl file and write their structured explanations",
+        epilog="LoLa Project"
+    )
+    argparser.add_argument('input', help="raw or cleaned e-SNLI csv/jsonl file, '-' for stdin")
+    argparser.add_argument('output', help="csv/jsonl file for the results, '-' for stdout")
+    argparser.add_argument('--input-format', choices=FORMATS, help="defaults to the input extension, jsonl for stdin")
+    argparser.add_argument('--output-format', choices=FORMATS, help="defaults to the output extension, jsonl for stdout")
+    argparser.add_argument('--batch-size', type=int, default=256, help="number of rows parsed together")
+    argparser.add_argument('--workers', type=int, default=1, help="number of worker processes sharing the loaded model and pattern sets")
+    argparser.add_argument('--start-method', choices=START_METHODS, default='fork', help="how the workers are started (default fork)")
+    argparser.add_argument('--pattern-stats', help="write per pattern counters to this file (.prom for Prometheus text, json otherwise)")
+    argparser.add_argument('--shard', type=_shard_spec, help="only structure the rows whose pairID hashes to shard i of N (i/N, e.g. 0/4), see sharding.py merge")
+    argparser.add_argument('--shard-size', type=int, help="write the results in shards of this many rows, with a manifest per shard")
+    argparser.add_argument('--output-dir', type=Path, help="directory of the shards, defaults to <output>.shards")
+    argparser.add_argument('--resume', action='store_true', help="keep the shards completed by a previous run and redo the others")
+
+    args = argparser.parse_args()
+
+    if args.resume and not args.shard_size:
+        argparser.error("--resume needs --shard-size")
+    if args.shard_size and '-' in (args.input, args.output):
+        argparser.error("sharded runs need input and output files")
+    if args.workers < 1:
+        argparser.error("--workers must be at least 1")
+    if args.workers > 1 and args.pattern_stats:
+        argparser.error("--pattern-stats is only collected with --workers 1")
+    if args.shard and '-' in (args.input, args.output):
+        argparser.error("--shard needs input and output files, the manifest written next to the output identifies the input")
+
+    stats = instrumentation.enable() if args.pattern_stats else None
+    # identified before the run, so that the manifest describes the input that was read
+    source = input_identity(args.input) if args.shard else None
+    pattern_sets = build_pattern_sets()
+    pool = None
+    if args.workers > 1:
+        # loaded before forking, so that the workers share the model and the pattern sets
+        pool = StructuringPool(args.workers, pattern_sets if args.start_method == 'fork' else None,
+                               args.batch_size, args.start_method)
+
+    try:
+        if args.shard_size:
+            _run_sharded(args, pattern_sets, pool)
+        else:
+            rows = _read_input(args)
+            with open_writer(args.output, args.output_format) as writer:
+                for result in _structure(rows, pattern_sets, args, pool):
+                    writer.write(result)
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    if pool is not None:
+        pool.close()
+
+    if args.shard:
+        write_shard_manifest(args.output, *args.shard, pattern_fingerprint(pattern_sets),
+                             infer_format(args.output, args.output_format), source)
+
+    if stats is not None:
+        stats.write(args.pattern_stats)
+
+
+if __name__ == '__main__':
+    main()
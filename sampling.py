@@ -0,0 +1,137 @@
+import math
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+
+
+def wilson_interval(p: float, n: float, confidence: float = 0.95) -> Tuple[float, float]:
+    """
+    Wilson score interval of a proportion p observed on n trials (n may be an effective size).
+
+    Args:
+        p (float): observed proportion.
+        n (float): number of trials.
+        confidence (float): level of the interval.
+
+    Returns:
+        tuple: lower and upper bound.
+    """
+    if n <= 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def length_bins(lengths: pd.Series, n_bins: int) -> pd.Series:
+    """
+    Quantile bin (0 to n_bins - 1) of every explanation length, bins with equal edges are merged.
+    """
+    if n_bins <= 1:
+        return pd.Series(0, index=lengths.index)
+    return pd.qcut(lengths.rank(method='first'), n_bins, labels=False, duplicates='drop').astype(int)
+
+
+@dataclass
+class CoverageEstimate:
+    """
+    Estimated proportion of covered rows of a group, with its confidence interval, the number of
+    sampled rows and the size of the group. The estimate is exact when the whole group is sampled.
+    """
+
+    group: str
+    coverage: float
+    low: float
+    high: float
+    sampled: int
+    population: int
+
+    @property
+    def margin(self) -> float:
+        return max(self.coverage - self.low, self.high - self.coverage)
+
+
+def stratified_estimate(group: str, covered: Dict, sampled: Dict, population: Dict, confidence: float = 0.95) -> CoverageEstimate:
+    """
+    Stratified estimate of the coverage of a group: covered, sampled and population map every
+    stratum of the group to its counts. The variance of the stratified proportion (with finite
+    population correction) gives an effective sample size for the Wilson interval.
+    """
+    total = sum(population.values())
+    n = sum(sampled.get(stratum, 0) for stratum in population)
+    p, variance = 0.0, 0.0
+    for stratum, size in population.items():
+        n_h = sampled.get(stratum, 0)
+        if not n_h:
+            continue
+        weight = size / total
+        p_h = covered.get(stratum, 0) / n_h
+        fpc = (size - n_h) / (size - 1) if size > 1 else 0.0
+        p += weight * p_h
+        variance += weight * weight * p_h * (1 - p_h) / n_h * fpc
+
+    if n >= total:
+        return CoverageEstimate(group, p, p, p, n, total)
+    # without observed variance (all or no row covered) fall back on the plain sample size
+    effective_n = p * (1 - p) / variance if variance > 0 else n
+    low, high = wilson_interval(p, effective_n, confidence)
+    return CoverageEstimate(group, p, low, high, n, total)
+
+
+class StratifiedSampler:
+    def __init__(self, strata: pd.Series, seed: Optional[int] = 0):
+        """
+        Progressive stratified sampling without replacement: every stratum is shuffled once, a
+        sample of a stratum is a prefix of its permutation, so growing a sample only draws new rows.
+
+        Args:
+            strata (pd.Series): stratum of every row, e.g. 'entailment:0' for a gold_label and a length bin.
+            seed (int): seed of the permutations.
+        """
+        rng = np.random.default_rng(seed)
+        self.order = {
+            stratum: rng.permutation(rows)
+            for stratum, rows in strata.groupby(strata, sort=True).indices.items()
+        }
+        self.taken = dict.fromkeys(self.order, 0)
+
+    @property
+    def sizes(self) -> Dict:
+        return {stratum: len(rows) for stratum, rows in self.order.items()}
+
+    def grow(self, targets: Dict) -> np.ndarray:
+        """
+        Extend the sample of every stratum to targets[stratum] rows (capped at its size).
+
+        Returns:
+            np.ndarray: positions of the newly sampled rows.
+        """
+        new = []
+        for stratum, target in targets.items():
+            target = min(int(target), len(self.order[stratum]))
+            if target > self.taken[stratum]:
+                new.append(self.order[stratum][self.taken[stratum]:target])
+                self.taken[stratum] = target
+        return np.concatenate(new) if new else np.zeros(0, dtype=np.int64)
+
+
+def allocate(n: int, sizes: Dict) -> Dict:
+    """
+    Proportional allocation of n rows to strata of the given sizes (largest remainders),
+    every non empty stratum getting at least one row.
+    """
+    total = sum(sizes.values())
+    n = min(n, total)
+    quotas = {stratum: n * size / total for stratum, size in sizes.items()}
+    allocation = {stratum: min(size, max(1, int(quotas[stratum]))) for stratum, size in sizes.items() if size}
+    remainders = sorted(sizes, key=lambda s: quotas[s] - int(quotas[s]), reverse=True)
+    for stratum in remainders:
+        if sum(allocation.values()) >= n:
+            break
+        if allocation.get(stratum, 0) < sizes[stratum]:
+            allocation[stratum] = allocation.get(stratum, 0) + 1
+    return allocation
@@ -0,0 +1,280 @@
+import asyncio
+import json
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple, Union
+from patterns.common import nlp
+from structuring import build_pattern_sets, structure
+
+HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+# largest request body accepted, a request explanation is a few hundred bytes
+MAX_BODY_BYTES = 1 << 20
+
+
+class UnknownLabelError(ValueError):
+    pass
+
+
+class PayloadTooLargeError(ValueError):
+    pass
+
+
+class ServiceUnavailableError(RuntimeError):
+    pass
+
+
+@dataclass
+class StructuringRequest:
+    explanation: str
+    highlights: List[str]
+    label: str
+
+
+class MicroBatcher:
+    def __init__(self, batch_size: int = 32, max_wait_ms: float = 10.0):
+        """
+        Queue structuring requests and process them in batches: a batch is flushed as soon as it
+        has batch_size requests or max_wait_ms after its first request arrived.
+        The spaCy model is loaded once and every batch is parsed with a single nlp.pipe call,
+        in a worker thread so that the event loop keeps accepting requests.
+
+        Args:
+            batch_size (int): maximum number of requests per batch.
+            max_wait_ms (float): maximum time a request waits for its batch to fill up.
+        """
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pattern_sets = build_pattern_sets()
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self._task: Optional[asyncio.Task] = None
+        # requests taken from the queue and not answered yet
+        self._batch: List[Tuple[StructuringRequest, asyncio.Future]] = []
+        self._stopped = False
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        Stop processing batches and fail the requests still waiting, in the queue or in the batch
+        being processed, with a ServiceUnavailableError so that their clients get an answer.
+        """
+        self._stopped = True
+        if self._task:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+        pending = self._batch
+        while self.queue is not None and not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(ServiceUnavailableError("The service is shutting down"))
+        self._batch = []
+        # let the handlers of the failed requests send their responses
+        await asyncio.sleep(0)
+
+    async def submit(self, request: StructuringRequest) -> dict:
+        """
+        Queue a request and wait for its result.
+        """
+        if request.label not in self.pattern_sets:
+            raise UnknownLabelError(f"Unknown label '{request.label}', expected one of {sorted(self.pattern_sets)}")
+        if self._stopped:
+            raise ServiceUnavailableError("The service is shutting down")
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((request, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch = batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            requests = [request for request, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self._process, requests)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._batch = []
+                continue
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self._batch = []
+
+    def _process(self, requests: List[StructuringRequest]) -> List[Union[dict, Exception]]:
+        """
+        Parse a batch and structure every request, a request failing to be structured gets its
+        exception instead of a result so that it does not fail the rest of the batch.
+        """
+        docs = nlp.pipe([r.explanation for r in requests], batch_size=self.batch_size)
+        results = []
+        for request, doc in zip(requests, docs):
+            try:
+                se = structure(doc, request.highlights, self.pattern_sets[request.label])
+                results.append({'structured_explanation': str(se), 'json': se.to_dict()})
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def _parse_request(body: bytes) -> StructuringRequest:
+    data = json.loads(body)
+    if not isinstance(data, dict) or not isinstance(data.get('explanation'), str) or not isinstance(data.get('label'), str):
+        raise ValueError("Expected a json object with 'explanation' and 'label' strings and optional 'highlights'")
+    highlights = data.get('highlights') or []
+    if not isinstance(highlights, list) or not all(isinstance(h, str) for h in highlights):
+        raise ValueError("'highlights' must be a list of strings")
+    return StructuringRequest(data['explanation'], highlights, data['label'])
+
+
+async def _read_request(reader: asyncio.StreamReader, max_body_bytes: int = MAX_BODY_BYTES) -> Optional[Tuple[str, str, dict, bytes]]:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        headers[key.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length < 0:
+        raise ValueError(f"Negative Content-Length {length}")
+    # checked before reading, so that the body is never buffered
+    if length > max_body_bytes:
+        raise PayloadTooLargeError(f"Request body of {length} bytes, at most {max_body_bytes} are accepted")
+    body = await reader.readexactly(length)
+    return method, target, headers, body
+
+
+def _response(status: int, payload: dict, keep_alive: bool) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode('latin-1') + body
+
+
+async def _structure(batcher: MicroBatcher, body: bytes) -> Tuple[int, dict]:
+    # only malformed requests are client errors, failures while structuring are server errors
+    try:
+        request = _parse_request(body)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    try:
+        return 200, await batcher.submit(request)
+    except UnknownLabelError as e:
+        return 400, {'error': str(e)}
+    except ServiceUnavailableError as e:
+        return 503, {'error': str(e)}
+    except Exception as e:
+        return 500, {'error': repr(e)}
+
+
+def make_handler(batcher: MicroBatcher, max_body_bytes: int = MAX_BODY_BYTES):
+    """
+    HTTP/1.1 handler with keep-alive serving POST /structure and GET /health.
+    POST /structure takes {"explanation": ..., "highlights": [...], "label": ...} and returns
+    {"structured_explanation": str form, "json": nested json form}. Bodies larger than
+    max_body_bytes are answered with 413 and the connection closed without reading them.
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader, max_body_bytes)
+                except PayloadTooLargeError as e:
+                    writer.write(_response(413, {'error': str(e)}, False))
+                    break
+                except (ValueError, asyncio.IncompleteReadError):
+                    writer.write(_response(400, {'error': "Malformed HTTP request"}, False))
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                if target == '/health':
+                    status, payload = 200, {'status': 'ok'}
+                elif target != '/structure':
+                    status, payload = 404, {'error': f"Unknown path {target}"}
+                elif method != 'POST':
+                    status, payload = 405, {'error': "Use POST"}
+                else:
+                    status, payload = await _structure(batcher, body)
+
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host: str, port: int, batch_size: int, max_wait_ms: float, max_body_bytes: int = MAX_BODY_BYTES):
+    batcher = MicroBatcher(batch_size, max_wait_ms)
+    batcher.start()
+    server = await asyncio.start_server(make_handler(batcher, max_body_bytes), host, port)
+    print(f"Structuring service listening on http://{host}:{port}/structure")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main():
+    argparser = ArgumentParser(
+        prog="Structuring service for Structured e-SNLI",
+        description="Local HTTP service structuring explanations with micro-batched spaCy parsing",
+        epilog="LoLa Project"
+    )
+    argparser.add_argument('--host', default='127.0.0.1')
+    argparser.add_argument('--port', type=int, default=8000)
+    argparser.add_argument('--batch-size', type=int, default=32, help="maximum number of explanations parsed together")
+    argparser.add_argument('--max-wait-ms', type=float, default=10.0, help="maximum time a request waits for its batch")
+    argparser.add_argument('--max-body-bytes', type=int, default=MAX_BODY_BYTES, help="larger request bodies are rejected with 413")
+
+    args = argparser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.batch_size, args.max_wait_ms, args.max_body_bytes))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+import csv
+import hashlib
+import io
+import json
+import mmap
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+from esnli_index import _scan_records
+from esnli_io import read_rows
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    """
+    Parse a shard specification 'i/N' (0 <= i < N).
+    """
+    try:
+        i, n = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected i/N, e.g. 0/4")
+    if n < 1 or not 0 <= i < n:
+        raise ValueError(f"Invalid shard '{spec}', expected 0 <= i < N")
+    return i, n
+
+
+def shard_of(pair_id: str, n_shards: int) -> int:
+    """
+    Shard of a pairID, from a hash that is the same on every machine and python process
+    (unlike hash(), which is salted per process).
+    """
+    digest = hashlib.blake2b(str(pair_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % n_shards
+
+
+def select_shard(rows: Iterable[dict], shard: int, n_shards: int) -> Iterator[dict]:
+    return (row for row in rows if shard_of(row['pairID'], n_shards) == shard)
+
+
+def is_covered(result: dict) -> bool:
+    """
+    A row is covered if at least one of its explanations could be structured, as in eval.ipynb.
+    """
+    return any(result.get(f'Explanation_{n}_Result') for n in range(1, 4))
+
+
+def coverage(results: Iterable[dict]) -> Dict[str, List[int]]:
+    """
+    Count [covered rows, rows] per gold label.
+    """
+    counts: Dict[str, List[int]] = {}
+    for result in results:
+        label_counts = counts.setdefault(str(result.get('gold_label')), [0, 0])
+        label_counts[0] += is_covered(result)
+        label_counts[1] += 1
+    return counts
+
+
+def manifest_path(output: Union[str, Path]) -> Path:
+    return Path(str(output) + MANIFEST_SUFFIX)
+
+
+def input_identity(path: Union[str, Path]) -> dict:
+    """
+    Identity of the input file of a shard run: its name, size and a hash of its content, so that
+    shards of different files or versions of a split are not merged. Paths may differ between
+    machines, only the size and the hash have to match.
+    """
+    path = Path(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'path': str(path), 'size': path.stat().st_size, 'digest': digest.hexdigest()}
+
+
+def write_shard_manifest(output: Union[str, Path], shard: int, n_shards: int, fingerprint: str, fmt: str, source: dict):
+    """
+    Write the manifest of the output of shard i/N next to it, with the identity of its input
+    (see input_identity) and its coverage per label.
+    """
+    counts = coverage(read_rows(str(output), fmt))
+    manifest = {
+        'shard': shard,
+        'n_shards': n_shards,
+        'fingerprint': fingerprint,
+        'input': source,
+        'format': fmt,
+        'rows': sum(total for _, total in counts.values()),
+        'coverage': counts,
+    }
+    manifest_path(output).write_text(json.dumps(manifest, indent=2))
+
+
+def _records(path: Path, fmt: str) -> Tuple[bytes, Iterator[Tuple[str, int, int]]]:
+    """
+    Header (csv only) and (pairID, offset, length) of every record of a shard output.
+    """
+    if fmt == 'csv':
+        header, records = _scan_records(path)
+        key_col = next(csv.reader([header.decode('utf-8')])).index('pairID')
+        return header, (
+            (next(csv.reader(io.StringIO(r.decode('utf-8'))))[key_col], offset, len(r)) for offset, r in records
+        )
+
+    def lines():
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)['pairID'], offset, len(line)
+                offset += len(line)
+    return b'', lines()
+
+
+def merge(outputs: List[Union[str, Path]], destination: Union[str, Path]) -> dict:
+    """
+    Check that the outputs of shards 0/N to N-1/N are all present and come from runs with the same
+    fingerprint on the same input file, then write them to destination sorted by pairID, with a
+    manifest holding the coverage per label of the whole dataset. Only the keys and offsets of the
+    records are held in memory, the records themselves are copied from memory mapped files.
+
+    Args:
+        outputs (list): output files of the shard runs.
+        destination (str): merged output file.
+
+    Returns:
+        dict: manifest of the merged output.
+
+    Raises:
+        ValueError: if shards are missing, duplicated or incompatible.
+    """
+    manifests = []
+    for output in outputs:
+        path = manifest_path(output)
+        if not path.exists():
+            raise ValueError(f"No manifest for {output}, was it written by run_structuring.py --shard?")
+        manifest = json.loads(path.read_text())
+        if not manifest.get('input'):
+            raise ValueError(f"The manifest of {output} does not record its input file, rerun the shard")
+        manifests.append(manifest)
+
+    n_shards = {m['n_shards'] for m in manifests}
+    fingerprints = {m['fingerprint'] for m in manifests}
+    formats = {m['format'] for m in manifests}
+    inputs = {(m['input']['size'], m['input']['digest']) for m in manifests}
+    if len(n_shards) != 1:
+        raise ValueError(f"Outputs come from different shard counts: {sorted(n_shards)}")
+    if len(fingerprints) != 1:
+        raise ValueError(f"Outputs come from incompatible runs (fingerprints {sorted(fingerprints)})")
+    if len(inputs) != 1:
+        paths = sorted({m['input']['path'] for m in manifests})
+        raise ValueError(f"Outputs come from different input files or versions of the input ({', '.join(paths)})")
+    if len(formats) != 1:
+        raise ValueError(f"Outputs have different formats: {sorted(formats)}")
+    n, fmt = n_shards.pop(), formats.pop()
+    shards = sorted(m['shard'] for m in manifests)
+    if shards != list(range(n)):
+        missing = sorted(set(range(n)) - set(shards))
+        duplicated = sorted({s for s in shards if shards.count(s) > 1})
+        raise ValueError(f"Expected shards 0 to {n - 1}, missing {missing}, duplicated {duplicated}")
+
+    header, keys = b'', []
+    for file_idx, output in enumerate(outputs):
+        file_header, records = _records(Path(output), fmt)
+        header = header or file_header
+        keys.extend((pair_id, file_idx, offset, length) for pair_id, offset, length in records)
+    keys.sort()
+
+    files = [open(output, 'rb') for output in outputs]
+    try:
+        maps = [mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if Path(f.name).stat().st_size else b'' for f in files]
+        with open(destination, 'wb') as out:
+            out.write(header)
+            for _, file_idx, offset, length in keys:
+                record = maps[file_idx][offset:offset + length]
+                out.write(record if record.endswith(b'\n') else record + b'\n')
+    finally:
+        for f in files:
+            f.close()
+
+    total: Dict[str, List[int]] = {}
+    for m in manifests:
+        for label, (covered, rows) in m['coverage'].items():
+            counts = total.setdefault(label, [0, 0])
+            counts[0] += covered
+            counts[1] += rows
+    merged = {
+        'n_shards': n,
+        'fingerprint': fingerprints.pop(),
+        'input': manifests[0]['input'],
+        'format': fmt,
+        'rows': len(keys),
+        'coverage': total,
+    }
+    manifest_path(destination).write_text(json.dumps(merged, indent=2))
+    return merged
+
+
+def format_coverage(counts: Dict[str, List[int]]) -> str:
+    lines = []
+    for label, (covered, rows) in sorted(counts.items()):
+        lines.append(f"({label}) Dataset coverage: {covered / rows * 100 if rows else 0:.2f}% ({covered}/{rows})")
+    return "\n".join(lines)
+
+
+def main():
+    argparser = ArgumentParser(
+        prog="Shard merging for Structured e-SNLI",
+        description="Merge the outputs of run_structuring.py --shard i/N runs into one file",
+        epilog="LoLa Project"
+    )
+    subparsers = argparser.add_subparsers(dest='command', required=True)
+    merge_parser = subparsers.add_parser('merge', help="validate and merge shard outputs, sorted by pairID")
+    merge_parser.add_argument('outputs', nargs='+', help="output files of the shard runs")
+    merge_parser.add_argument('-o', '--output', required=True, help="merged output file")
+
+    args = argparser.parse_args()
+
+    if args.command == 'merge':
+        try:
+            merged = merge(args.outputs, args.output)
+        except ValueError as e:
+            argparser.exit(1, f"error: {e}\n")
+        print(f"merged {merged['rows']} rows from {merged['n_shards']} shards into {args.output}")
+        print(format_coverage(merged['coverage']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import ast
+import inspect
+import json
+import math
+import spacy
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+from spacy.tokens.doc import Doc
+from checkpoint import fingerprint, source_fingerprint
+from patterns.common import nlp
+from patterns import rules
+from patterns.abstract import AbstractPattern, StructuredExplanation
+from patterns.entailment import *
+from patterns.contradiction import *
+from patterns.neutral import *
+from preprocessing import ESNLIPreprocessor
+
+LABELS = ('entailment', 'contradiction', 'neutral')
+N_EXPLANATIONS = 3
+# values read as missing from csv files, like pandas does for the e-SNLI splits
+MISSING_VALUES = {'', 'NA', 'N/A', 'NaN', 'nan', 'null', 'None'}
+
+
+def build_pattern_sets() -> Dict[str, List[AbstractPattern]]:
+    """
+    Build the pattern classes used to structure the explanations of each label.
+
+    Returns:
+        dict: label -> list of pattern instances.
+    """
+    return {
+        'entailment': [RephrasingPattern(), ImplicationPattern(), EquivalencePattern(), IfThenPattern(), ClassificationPattern()],
+        'contradiction': [NotRephrasingPattern(), NotImplicationPattern(), NotEquivalencePattern(), XORPattern(), IfThenPattern(), NotClassificationPattern(), CannotBePattern()],
+        'neutral': [NeutralImplicationPattern(), NotAllPattern()],
+    }
+
+
+def pattern_fingerprint(pattern_sets: Dict[str, List[AbstractPattern]]) -> str:
+    """
+    Fingerprint of the pattern tables, the source of the patterns package and the spaCy model,
+    used to tell whether two structuring runs produce comparable results.
+    """
+    tables = {
+        label: [(type(p).__name__, sorted(p.patterns.items()), p.relationship, p.negate, p.dependency_rules) for p in patterns]
+        for label, patterns in sorted(pattern_sets.items())
+    }
+    dependency_rules = [(name, rule.pattern) for name, rule in sorted(rules.engine.rules.items())]
+    sources = source_fingerprint(*Path(inspect.getfile(AbstractPattern)).parent.glob('*.py'))
+    model = (nlp.meta.get('name'), nlp.meta.get('version'), spacy.__version__)
+    return fingerprint(tables, dependency_rules, sources, model)
+
+
+def is_missing(value) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float):
+        return math.isnan(value)
+    return isinstance(value, str) and value.strip() in MISSING_VALUES
+
+
+def get_highlights(row, n: int) -> List[str]:
+    """
+    Get the ordered highlights of both sentences for the n-th explanation of an e-SNLI row.
+    Preprocessed rows store them as lists (or their string representation when read back from
+    a cleaned csv file), raw rows only have the marked sentences, which are parsed on the fly.
+
+    Args:
+        row (dict or pd.Series): raw or preprocessed e-SNLI row.
+        n (int): explanation number (1 to 3).
+
+    Returns:
+        list: highlighted phrases of Sentence1 followed by the ones of Sentence2.
+    """
+    highlights = []
+    for sentence in ('Sentence1', 'Sentence2'):
+        ordered = f'{sentence}_Highlighted_Ordered_{n}'
+        if ordered in row:
+            value = row.get(ordered)
+            if isinstance(value, str):
+                value = ast.literal_eval(value) if not is_missing(value) else []
+        else:
+            marked = row.get(f'{sentence}_marked_{n}')
+            value = ESNLIPreprocessor._extract_ordered_highlighted_phrases(None if is_missing(marked) else marked)
+        if isinstance(value, list):
+            highlights.extend(value)
+    return highlights
+
+
+def structure(doc: Doc, highlights: List[str], patterns: List[AbstractPattern]) -> StructuredExplanation:
+    """
+    Apply a set of pattern classes to a parsed explanation and concatenate what they found.
+
+    Args:
+        doc (Doc): parsed explanation.
+        highlights (list): highlighted phrases used to ground the predicates.
+        patterns (list): pattern instances, usually one of the sets of build_pattern_sets.
+
+    Returns:
+        StructuredExplanation: the conjunction of the non empty explanations.
+    """
+    # one DependencyMatcher pass for the rules of every pattern class, cached on the doc
+    rules.engine.matches(doc)
+    explanations = [se for se in (pattern(doc, highlights) for pattern in patterns) if se]
+    return AbstractPattern.concatenate_explanations(explanations)
+
+
+def structure_rows(rows: List[dict], pattern_sets: Dict[str, List[AbstractPattern]], batch_size: int = 256) -> List[dict]:
+    """
+    Structure every explanation of a batch of e-SNLI rows, parsing all of them with one nlp.pipe call.
+
+    Args:
+        rows (list): raw or preprocessed e-SNLI rows.
+        pattern_sets (dict): label -> pattern instances, see build_pattern_sets.
+        batch_size (int): batch size of nlp.pipe.
+
+    Returns:
+        list: one result per row with pairID, gold_label and for every explanation its text,
+        the string form of its structured explanation (Explanation_n_Result) and its json form
+        (Explanation_n_Structure). Rows with an unknown label get empty explanations.
+    """
+    jobs = []
+    for i, row in enumerate(rows):
+        for n in range(1, N_EXPLANATIONS + 1):
+            text = row.get(f'Explanation_{n}')
+            if not is_missing(text):
+                jobs.append((i, n, str(text)))
+
+    results = [{'pairID': row.get('pairID'), 'gold_label': row.get('gold_label')} for row in rows]
+    docs = nlp.pipe([text for _, _, text in jobs], batch_size=batch_size)
+    for (i, n, text), doc in zip(jobs, docs):
+        patterns = pattern_sets.get(rows[i].get('gold_label'), [])
+        se = structure(doc, get_highlights(rows[i], n), patterns)
+        results[i][f'Explanation_{n}'] = text
+        results[i][f'Explanation_{n}_Result'] = str(se)
+        results[i][f'Explanation_{n}_Structure'] = se.to_dict()
+    return results
+
+
+def result_structure(result: dict, n: int) -> Optional[StructuredExplanation]:
+    """
+    Structured explanation of the n-th explanation of a result of structure_rows, also when read
+    back from a file where Explanation_n_Structure is a json string.
+
+    Returns:
+        StructuredExplanation: None if the result has no structure for this explanation.
+    """
+    structure = result.get(f'Explanation_{n}_Structure')
+    if isinstance(structure, str):
+        structure = json.loads(structure) if structure else None
+    return StructuredExplanation.from_dict(structure) if structure else None
+
+
+def structure_stream(rows: Iterable[dict], pattern_sets: Optional[Dict[str, List[AbstractPattern]]] = None,
+                     batch_size: int = 256) -> Iterator[dict]:
+    """
+    Lazily structure a stream of e-SNLI rows, batch_size rows at a time, so that results are
+    yielded as soon as their batch is done and memory does not grow with the input.
+
+    Args:
+        rows (iterable): raw or preprocessed e-SNLI rows as dicts, e.g. from csv.DictReader.
+        pattern_sets (dict): label -> pattern instances, built with build_pattern_sets if not given.
+        batch_size (int): number of rows parsed together.
+
+    Returns:
+        iterator: one result per row, see structure_rows.
+    """
+    pattern_sets = pattern_sets or build_pattern_sets()
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield from structure_rows(batch, pattern_sets, batch_size)
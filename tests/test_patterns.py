@@ -0,0 +1,127 @@
+import pytest
+from typing import List, NamedTuple, Tuple
+from spacy.tokens.doc import Doc
+from patterns import rules
+from patterns.common import nlp
+from patterns.abstract import AbstractPattern
+from patterns.entailment import ClassificationPattern, EquivalencePattern, RephrasingPattern
+from patterns.contradiction import NotClassificationPattern
+from structuring import build_pattern_sets, structure
+
+
+class Case(NamedTuple):
+    """
+    A sentence with its dependency parse written out by hand, as (word, head index, dep, pos),
+    so that the test does not depend on the parser of the installed spaCy model.
+    """
+    name: str
+    pattern: AbstractPattern
+    tokens: Tuple[Tuple[str, int, str, str], ...]
+    highlights: List[str]
+    expected: str
+
+
+def make_doc(tokens: Tuple[Tuple[str, int, str, str], ...]) -> Doc:
+    words, heads, deps, pos = zip(*tokens)
+    lemmas = ["be" if word in ("is", "are") else word.lower() for word in words]
+    return Doc(nlp.vocab, words=list(words), heads=list(heads), deps=list(deps), pos=list(pos), lemmas=lemmas)
+
+
+CASES = [
+    Case(
+        "left term is the subtree of the first left child of the anchor's head",
+        ClassificationPattern(),
+        (("the", 1, "det", "DET"), ("dog", 2, "nsubj", "NOUN"), ("is", 2, "ROOT", "AUX"), ("a", 4, "det", "DET"),
+         ("type", 2, "attr", "NOUN"), ("of", 4, "prep", "ADP"), ("animal", 5, "pobj", "NOUN")),
+        [],
+        "the dog ⊆ animal",
+    ),
+    Case(
+        "terms are grounded on the highlights",
+        ClassificationPattern(),
+        (("the", 1, "det", "DET"), ("dog", 2, "nsubj", "NOUN"), ("is", 2, "ROOT", "AUX"), ("a", 4, "det", "DET"),
+         ("type", 2, "attr", "NOUN"), ("of", 4, "prep", "ADP"), ("animal", 5, "pobj", "NOUN")),
+        ["dog", "animal"],
+        "dog ⊆ animal",
+    ),
+    Case(
+        "anchor without a head falls back on the tokens on its left",
+        ClassificationPattern(),
+        (("a", 1, "det", "DET"), ("poodle", 2, "compound", "NOUN"), ("type", 2, "ROOT", "NOUN"),
+         ("of", 2, "prep", "ADP"), ("dog", 3, "pobj", "NOUN")),
+        [],
+        "a poodle ⊆ poodle dog",
+    ),
+    Case(
+        "negated classification",
+        NotClassificationPattern(),
+        (("the", 1, "det", "DET"), ("dog", 2, "nsubj", "NOUN"), ("is", 2, "ROOT", "AUX"), ("not", 4, "neg", "PART"),
+         ("type", 2, "attr", "NOUN"), ("of", 4, "prep", "ADP"), ("cat", 5, "pobj", "NOUN")),
+        [],
+        "the dog ⊈ cat",
+    ),
+    Case(
+        "X is a Y gives a classification",
+        ClassificationPattern(),
+        (("a", 1, "det", "DET"), ("poodle", 2, "nsubj", "NOUN"), ("is", 2, "ROOT", "AUX"), ("a", 4, "det", "DET"),
+         ("dog", 2, "attr", "NOUN"), (".", 2, "punct", "PUNCT")),
+        [],
+        "a poodle ⊆ a dog",
+    ),
+    Case(
+        "X is a Y is left to the trigger patterns when Y is a trigger word",
+        ClassificationPattern(),
+        (("a", 1, "det", "DET"), ("poodle", 2, "nsubj", "NOUN"), ("is", 2, "ROOT", "AUX"), ("a", 4, "det", "DET"),
+         ("synonym", 2, "attr", "NOUN"), ("for", 4, "prep", "ADP"), ("dog", 5, "pobj", "NOUN")),
+        [],
+        "",
+    ),
+    Case(
+        "rephrasing keeps the trigger words in both terms",
+        RephrasingPattern(),
+        (("stanford", 1, "nsubj", "PROPN"), ("is", 1, "ROOT", "AUX"), ("short", 1, "acomp", "ADJ"),
+         ("for", 2, "prep", "ADP"), ("university", 3, "pobj", "NOUN")),
+        [],
+        "stanford is short for ↔ university is short for",
+    ),
+    Case(
+        "equivalence between the subject and the object of same as",
+        EquivalencePattern(),
+        (("a", 1, "det", "DET"), ("puppy", 2, "nsubj", "NOUN"), ("is", 2, "ROOT", "AUX"), ("the", 4, "det", "DET"),
+         ("same", 2, "attr", "ADJ"), ("as", 4, "prep", "ADP"), ("a", 7, "det", "DET"), ("dog", 5, "pobj", "NOUN")),
+        [],
+        "a puppy ⊆ a dog",
+    ),
+]
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case.name for case in CASES])
+def test_pattern_output(case: Case):
+    assert str(case.pattern(make_doc(case.tokens), case.highlights)) == case.expected
+
+
+class CountingMatcher():
+    def __init__(self, matcher):
+        self.matcher, self.vocab, self.calls = matcher, matcher.vocab, 0
+
+    def __call__(self, doc):
+        self.calls += 1
+        return self.matcher(doc)
+
+
+def test_rules_run_once_per_doc(monkeypatch):
+    matcher = CountingMatcher(rules.engine.matcher)
+    monkeypatch.setattr(rules.engine, 'matcher', matcher)
+    doc = make_doc(CASES[4].tokens)
+
+    se = structure(doc, [], build_pattern_sets()['entailment'])
+
+    assert str(se) == "a poodle ⊆ a dog"
+    assert matcher.calls == 1
+    assert rules.USER_DATA_KEY in doc.user_data
+    assert rules.engine.matches(doc)['is_a'] == [(2, 1, 4)]
+
+
+def test_rules_need_a_dependency_parse():
+    doc = Doc(nlp.vocab, words=["a", "poodle", "is", "a", "dog"])
+    assert rules.engine.matches(doc) == {name: [] for name in rules.engine.rules}
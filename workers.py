@@ -0,0 +1,106 @@
+import gc
+import multiprocessing
+from collections import deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+from patterns.abstract import AbstractPattern
+from structuring import build_pattern_sets, structure_rows
+
+START_METHODS = ('fork', 'forkserver')
+
+# pattern sets of the worker processes, inherited from the parent with fork
+_pattern_sets: Optional[Dict[str, List[AbstractPattern]]] = None
+
+
+def _init_worker():
+    global _pattern_sets
+    # with fork the parent's pattern sets are already there, forkserver workers build their own
+    # (the spaCy model itself is preloaded by the fork server)
+    if _pattern_sets is None:
+        _pattern_sets = build_pattern_sets()
+
+
+def _structure_batch(rows: List[dict], batch_size: int) -> List[dict]:
+    return structure_rows(rows, _pattern_sets, batch_size)
+
+
+class StructuringPool:
+    def __init__(self, workers: int, pattern_sets: Optional[Dict[str, List[AbstractPattern]]] = None,
+                 batch_size: int = 256, start_method: str = 'fork'):
+        """
+        Pool of worker processes structuring batches of e-SNLI rows.
+
+        With 'fork' the spaCy model and the pattern sets are loaded once in the parent and the
+        workers inherit them copy-on-write, only the row batches and the results go through the
+        pipes. The objects loaded so far are moved to the permanent generation (gc.freeze) before
+        forking, so that garbage collections in the workers do not write to, and copy, their pages.
+        With 'forkserver' the fork server preloads the structuring module, i.e. the model, and
+        every worker builds the pattern sets once.
+
+        Args:
+            workers (int): number of worker processes.
+            pattern_sets (dict): label -> pattern instances, built with build_pattern_sets if not given
+                (only with 'fork').
+            batch_size (int): number of rows sent to a worker at a time, also the nlp.pipe batch size.
+            start_method (str): 'fork' or 'forkserver'.
+        """
+        if workers < 1:
+            raise ValueError(f"Expected at least one worker, got {workers}")
+        if start_method not in START_METHODS:
+            raise ValueError(f"Unknown start method '{start_method}', use one of {START_METHODS}")
+        self.workers = workers
+        self.batch_size = batch_size
+        context = multiprocessing.get_context(start_method)
+
+        global _pattern_sets
+        if start_method == 'fork':
+            _pattern_sets = pattern_sets or build_pattern_sets()
+        elif pattern_sets is not None:
+            raise ValueError("forkserver workers build the default pattern sets, custom ones need the fork start method")
+        else:
+            context.set_forkserver_preload(['structuring'])
+
+        gc.freeze()
+        self.pool = context.Pool(workers, initializer=_init_worker)
+
+    def imap(self, rows: Iterable[dict]) -> Iterator[dict]:
+        """
+        Structure a stream of rows in the workers, yielding the results in input order.
+        At most two batches per worker are in flight, so memory does not grow with the input.
+
+        Args:
+            rows (iterable): raw or preprocessed e-SNLI rows as dicts.
+
+        Returns:
+            iterator: one result per row, see structuring.structure_rows.
+        """
+        rows = iter(rows)
+        pending = deque()
+        while True:
+            while len(pending) < 2 * self.workers:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                pending.append(self.pool.apply_async(_structure_batch, (batch, self.batch_size)))
+            if not pending:
+                return
+            yield from pending.popleft().get()
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        gc.unfreeze()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+        gc.unfreeze()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()